@@ -0,0 +1,54 @@
+"""
+Benchmarks the response serializers on a 10k item inventory payload.
+
+Run from the repository root:
+    python benchmarks/response_serializer_benchmark.py
+"""
+import json
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from utils.response_serializer import ResponseSerializer, OrjsonResponseSerializer, orjson
+
+ITEM_COUNT = 10_000
+REPEAT = 20
+
+def build_inventory(item_count: int) -> pd.DataFrame:
+    """Builds an inventory DataFrame shaped like the INVENTORY table."""
+    return pd.DataFrame({
+        'item_id': range(1, item_count + 1),
+        'item_name': [f'Toaster model {i}' for i in range(1, item_count + 1)],
+        'unit_price': [round(19.99 + i % 500, 2) for i in range(item_count)],
+        'stock_quantity': [i % 250 for i in range(item_count)],
+        'weight': [round(1.5 + i % 7 / 4, 2) for i in range(item_count)]
+    })
+
+
+def bench(name: str, fn) -> float:
+    seconds = min(timeit.repeat(fn, number=1, repeat=REPEAT))
+    print(f'{name:<45} {seconds * 1000:8.2f} ms')
+    return seconds
+
+
+if __name__ == '__main__':
+    inventory = build_inventory(ITEM_COUNT)
+    records = inventory.to_dict('records')
+    decimal_records = [{**record, 'unit_price': Decimal(f'{record["unit_price"]:.2f}')} for record in records]
+
+    print(f'{ITEM_COUNT} items, best of {REPEAT} runs')
+    baseline = bench('json.dumps (previous Router behavior)', lambda: json.dumps(records))
+    bench('ResponseSerializer', lambda: ResponseSerializer().dumps(records))
+    bench('ResponseSerializer, Decimal prices', lambda: ResponseSerializer().dumps(decimal_records))
+
+    if orjson is None:
+        print('orjson is not installed, skipping OrjsonResponseSerializer.')
+    else:
+        fast = bench('OrjsonResponseSerializer', lambda: OrjsonResponseSerializer().dumps(records))
+        bench('OrjsonResponseSerializer, Decimal prices', lambda: OrjsonResponseSerializer().dumps(decimal_records))
+        print(f'Speedup over json.dumps: {baseline / fast:.1f}x')
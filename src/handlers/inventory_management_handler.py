@@ -1,3 +1,6 @@
+import base64
+import io
+
 import sqlalchemy as sa
 import pandas as pd
 
@@ -25,6 +28,12 @@ class InventoryManagementHandler():
         path = event['resource']
         if path == '/inventory-management/inventory':
             status_code, body = self.get_inventory(event['queryStringParameters'])
+        elif path == '/inventory-management/inventory/stats':
+            status_code, body = self.get_inventory_stats(event['queryStringParameters'])
+        elif path == '/inventory-management/inventory/search':
+            status_code, body = self.search_items(event['queryStringParameters'])
+        elif path == '/inventory-management/inventory/import':
+            status_code, body = self.post_inventory_import(event)
         elif path == '/inventory-management/inventory/items/{id}':
             status_code, body = self.get_item_from_id(event['pathParameters'])
         elif path == '/inventory-management/inventory/items':
@@ -57,6 +66,115 @@ class InventoryManagementHandler():
         return 200, self._manager.get_inventory(only_items_in_stock).to_dict('records')
 
 
+    def get_inventory_stats(self, query_str_params: dict | None) -> tuple[int, dict | str]:
+        """
+        Retrieves inventory analytics: stock value, low stock items and sales velocity.
+
+        Parameters
+        ----------
+        query_str_params : dict | None
+            The query string parameters from the event.
+            ``low_stock_threshold`` (default 10), ``window_orders`` (default 1000)
+            and ``top`` (default 100, at most 1000) are optional.
+
+        Returns
+        -------
+        tuple[int, dict | str]
+            An HTTP status code and a message.
+            If no error, the message is a dictionary of the inventory stats.
+        """
+        params = query_str_params if isinstance(query_str_params, dict) else {}
+        low_stock_threshold = params.get('low_stock_threshold', '10')
+        window_orders = params.get('window_orders', '1000')
+        top = params.get('top', '100')
+
+        if not low_stock_threshold.isdigit():
+            return 400, 'low_stock_threshold needs to be a non-negative integer.'
+        if not window_orders.isdigit() or int(window_orders) == 0:
+            return 400, 'window_orders needs to be a positive integer.'
+        if not top.isdigit() or int(top) == 0:
+            return 400, 'top needs to be a positive integer.'
+
+        return 200, self._manager.get_inventory_stats(int(low_stock_threshold), int(window_orders), min(int(top), 1000))
+
+
+    def post_inventory_import(self, event: dict) -> tuple[int, dict | str]:
+        """
+        Imports item upserts and stock adjustments from a CSV or JSON lines upload.
+
+        Parameters
+        ----------
+        event : dict
+            The event from the HTTP request. The body is the upload, optionally base64 encoded.
+            The format is taken from the ``format`` query string parameter (``csv`` or ``jsonl``),
+            or from the Content-Type header (``text/csv`` or ``application/x-ndjson``/``application/jsonl``).
+            The request must have gone through an API Gateway authorizer (Lambda or Cognito):
+            imports can rewrite every price and stock level.
+
+        Returns
+        -------
+        tuple[int, dict | str]
+            An HTTP status code and a message.
+            If the upload could be read, the message is a summary of the import with per-row errors.
+        """
+        if not (event.get('requestContext') or {}).get('authorizer'):
+            return 403, 'Inventory imports require an authorized caller.'
+
+        body = event.get('body')
+        if not body:
+            return 400, 'Missing request body.'
+
+        query_str_params = event.get('queryStringParameters') or {}
+        headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+        format = query_str_params.get('format')
+        if format is None:
+            content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+            format = {
+                'text/csv': 'csv',
+                'application/x-ndjson': 'jsonl',
+                'application/jsonl': 'jsonl'
+            }.get(content_type)
+
+        if format not in self._manager.IMPORT_FORMATS:
+            return 400, 'Unknown import format, expected "csv" or "jsonl".'
+
+        if event.get('isBase64Encoded'):
+            try:
+                body = base64.b64decode(body).decode('utf-8-sig')
+            except ValueError:
+                return 400, 'Request body is not valid base64 encoded UTF-8.'
+
+        # newline='' lets the csv module handle line breaks inside quoted fields
+        return 200, self._manager.import_inventory(io.StringIO(body, newline=''), format)
+
+
+    def search_items(self, query_str_params: dict | None) -> tuple[int, dict | str]:
+        """
+        Searches items by name prefix, case-insensitively.
+
+        Parameters
+        ----------
+        query_str_params : dict | None
+            The query string parameters from the event. ``prefix`` is required,
+            ``limit`` (default 20, at most 100) is optional.
+
+        Returns
+        -------
+        tuple[int, dict | str]
+            An HTTP status code and a message.
+            If no error, the message is a dictionary of the items found, which may be empty.
+        """
+        if not isinstance(query_str_params, dict) or not query_str_params.get('prefix'):
+            return 400, 'Missing query string parameter, prefix.'
+
+        limit = query_str_params.get('limit', '20')
+        if not limit.isdigit() or int(limit) == 0:
+            return 400, 'limit needs to be a positive integer.'
+
+        items = self._manager.search_items_by_name(query_str_params['prefix'], min(int(limit), 100))
+        return 200, items.to_dict('records')
+
+
     def get_item(self, multi_query_str_params: dict | None, query_str_params: dict | None) -> tuple[int, dict | str]:
         """
         Retrieves items based on params.
@@ -3,38 +3,60 @@ import json
 import sqlalchemy as sa
 
 from services.order_processing_service import OrderProcessingService
+from services.order_lookup_service import OrderLookupService
+from utils.order_queue import OrderQueue
+from utils.stage_pipeline import StagePipeline
 
 class OrderProcessingHandler():
     """Handles events (HTTP requests) for the order-processing resource."""
     _engine: sa.engine.Engine
     _processor: OrderProcessingService
+    _lookup: OrderLookupService
+    _queue: OrderQueue | None
 
-    def __init__(self, engine: sa.engine.Engine):
+    # Cache-Control headers for order responses. Orders in a terminal status never change again.
+    _TERMINAL_CACHE_HEADERS = {'Cache-Control': 'private, max-age=86400, immutable'}
+    _NO_CACHE_HEADERS = {'Cache-Control': 'no-cache'}
+    _MAX_PAGE_SIZE = 100
+
+    def __init__(self, engine: sa.engine.Engine, queue: OrderQueue | None = None):
         """
         Parameters
         ----------
         engine : sqlalchemy.engine.Engine
             The engine to connect to the database with the Inventory information.
+        queue : OrderQueue | None = None
+            The queue to put accepted orders on for asynchronous processing.
+            Defaults to the queue configured in the environment. If there is none,
+            orders are processed synchronously.
         """
         super().__init__()
         self._engine = engine
         self._processor = OrderProcessingService(self._engine)
+        self._lookup = OrderLookupService(self._engine)
+        self._queue = queue if queue is not None else OrderQueue.from_environment()
 
 
-    def handle_request(self, event, context) -> tuple[int, dict | str]:
-        """Handles requests related to the order-processing resource."""
+    def handle_request(self, event, context) -> tuple[int, dict | str] | tuple[int, dict | str, dict]:
+        """
+        Handles requests related to the order-processing resource.
+        Read endpoints also return the response headers (for caching) as a third element.
+        """
         path = event['resource']
 
         if path == '/order-processing/order':
-            status_code, body = self.post_order(event['body'])
-        else:
-            status_code = 400
-            body = 'Unknown path for order-processing resource.'
-
-        return status_code, body
+            return self.post_order(event['body'], context)
+        elif path == '/order-processing/order/{id}':
+            return self.get_order(event['pathParameters'])
+        elif path == '/order-processing/order/tracking/{tracking_id}':
+            return self.get_order_by_tracking_id(event['pathParameters'])
+        elif path == '/order-processing/orders':
+            return self.get_customer_orders(event['queryStringParameters'])
+
+        return 400, 'Unknown path for order-processing resource.'
     
 
-    def post_order(self, order) -> tuple[int, str | dict]:
+    def post_order(self, order, context=None) -> tuple[int, str | dict]:
         """
         POST an order to the database.
 
@@ -42,17 +64,23 @@ class OrderProcessingHandler():
         ----------
         order : Any
             The order to be posted. Order will be validated.
+        context : LambdaContext | None = None
+            The context from the HTTP request. Its remaining time bounds the order processing.
         
         Returns
         -------
         tuple[int, str | dict]
             An HTTP status code and a message. If no error, message is confirmation number.
+            If orders are processed asynchronously, returns 202 and the tracking ID of the order instead.
         """
         if not self.__validate_order__(order):
             return 400, 'Order not properly formatted.'
 
         order = json.loads(order)
-        status_code, msg =  self._processor.process_order(order)
+        if self._queue is not None:
+            return 202, {'tracking_id': self._queue.enqueue(order)}
+
+        status_code, msg =  self._processor.process_order(order, deadline=StagePipeline.deadline_from_context(context))
 
         if isinstance(msg, int):
             msg = {
@@ -62,6 +90,105 @@ class OrderProcessingHandler():
         return status_code, msg
 
 
+    def get_order(self, path_params: dict | None) -> tuple[int, dict | str, dict]:
+        """
+        Retrieves an order with its line items based on its ID.
+
+        Parameters
+        ----------
+        path_params : dict | None
+            The path parameters from the event.
+
+        Returns
+        -------
+        tuple[int, dict | str, dict]
+            An HTTP status code, a message and the response headers.
+            If the order is found, the message is a dictionary of the order.
+            Orders in a terminal status are marked as cacheable.
+        """
+        if not isinstance(path_params, dict) or 'id' not in path_params:
+            return 400, 'Missing path parameter, order ID.', self._NO_CACHE_HEADERS
+
+        if not path_params['id'].isdigit():
+            return 400, 'ID needs to be a positive integer.', self._NO_CACHE_HEADERS
+
+        id = int(path_params['id'])
+        order = self._lookup.get_order_by_id(id)
+
+        if order is None:
+            return 404, f'No order with ID {id} found.', self._NO_CACHE_HEADERS
+
+        headers = self._TERMINAL_CACHE_HEADERS if self._lookup.is_terminal(order) else self._NO_CACHE_HEADERS
+        return 200, order, headers
+
+
+    def get_order_by_tracking_id(self, path_params: dict | None) -> tuple[int, dict | str, dict]:
+        """
+        Retrieves an order accepted for asynchronous processing based on its tracking ID.
+
+        Parameters
+        ----------
+        path_params : dict | None
+            The path parameters from the event.
+
+        Returns
+        -------
+        tuple[int, dict | str, dict]
+            An HTTP status code, a message and the response headers.
+            If a worker picked the order up, the message is a dictionary of the order
+            (Pending while it's processed, Cancelled if it was rejected).
+        """
+        if not isinstance(path_params, dict) or not path_params.get('tracking_id'):
+            return 400, 'Missing path parameter, tracking ID.', self._NO_CACHE_HEADERS
+
+        tracking_id = path_params['tracking_id']
+        order = self._lookup.get_order_by_tracking_id(tracking_id)
+
+        if order is None:
+            return 404, f'No order with tracking ID {tracking_id} found, it may not be picked up yet.', self._NO_CACHE_HEADERS
+
+        headers = self._TERMINAL_CACHE_HEADERS if self._lookup.is_terminal(order) else self._NO_CACHE_HEADERS
+        return 200, order, headers
+
+
+    def get_customer_orders(self, query_str_params: dict | None) -> tuple[int, dict | str, dict]:
+        """
+        Retrieves a page of orders placed by a customer.
+
+        Parameters
+        ----------
+        query_str_params : dict | None
+            The query string parameters from the event. ``customer_name`` is required.
+            ``limit`` (default 20, at most 100) and ``cursor`` (from the previous page) are optional.
+
+        Returns
+        -------
+        tuple[int, dict | str, dict]
+            An HTTP status code, a message and the response headers.
+            If no error, the message is a dictionary with the ``orders`` and the ``next_cursor``.
+        """
+        if not isinstance(query_str_params, dict) or not query_str_params.get('customer_name'):
+            return 400, 'Missing query string parameter, customer_name.', self._NO_CACHE_HEADERS
+
+        limit = query_str_params.get('limit', '20')
+        cursor = query_str_params.get('cursor')
+        if not limit.isdigit() or int(limit) == 0:
+            return 400, 'limit needs to be a positive integer.', self._NO_CACHE_HEADERS
+        if cursor is not None and not cursor.isdigit():
+            return 400, 'cursor needs to be a positive integer.', self._NO_CACHE_HEADERS
+
+        orders, next_cursor = self._lookup.get_orders_by_customer(
+            query_str_params['customer_name'],
+            min(int(limit), self._MAX_PAGE_SIZE),
+            int(cursor) if cursor is not None else None
+        )
+        body = {
+            'orders': orders,
+            'next_cursor': next_cursor
+        }
+        return 200, body, self._NO_CACHE_HEADERS
+
+
     def __validate_order__(self, order) -> bool:
         """
         Validates if the raw order has all the information required.
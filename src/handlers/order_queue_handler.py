@@ -0,0 +1,83 @@
+import sqlalchemy as sa
+
+from services.order_processing_service import OrderProcessingService
+from utils.metrics import Metrics
+from utils.order_queue import OrderQueue
+from utils.stage_pipeline import StagePipeline
+
+class OrderQueueHandler():
+    """Handles batches of queued orders (SQS events) accepted by the order-processing resource."""
+    _engine: sa.engine.Engine
+    _queue: OrderQueue
+    _processor: OrderProcessingService
+
+    def __init__(self, engine: sa.engine.Engine, queue: OrderQueue | None = None):
+        """
+        Parameters
+        ----------
+        engine : sqlalchemy.engine.Engine
+            The engine to connect to the database to process the orders with.
+        queue : OrderQueue | None = None
+            The queue the orders were put on, to read its messages with.
+            Defaults to the queue configured in the environment.
+        """
+        super().__init__()
+        self._engine = engine
+        self._queue = queue if queue is not None else OrderQueue.from_environment()
+        if self._queue is None:
+            raise ValueError('No order queue configured.')
+        self._processor = OrderProcessingService(self._engine)
+
+
+    def handle_batch(self, event: dict, context) -> dict:
+        """
+        Processes a batch of queued orders.
+
+        Orders that fail with a server error are reported back so only they are retried (and eventually
+        sent to the dead-letter queue), instead of the whole batch. This includes orders that fail after
+        being charged (counted by ``ChargedOrderRetries``): a retry resumes the claimed order without
+        charging it again.
+        Orders rejected for a client reason (not enough stock, payment declined) won't succeed on a retry,
+        so they're logged and dropped, their tracking ID reports them as Cancelled.
+        Redelivered orders (the queue delivers at least once) are deduplicated by `OrderProcessingService`.
+
+        Parameters
+        ----------
+        event : dict
+            The SQS event, with the queued messages in ``Records``.
+        context : LambdaContext
+            The context of the invocation.
+
+        Returns
+        -------
+        dict
+            The partial batch response, ``batchItemFailures`` lists the messages to retry.
+        """
+        failures = []
+        for record in event.get('Records', []):
+            message_id = record['messageId']
+            try:
+                tracking_id, order = self._queue.read(record['body'])
+            except Exception as err:
+                print(f'Message {message_id} could not be read, will be retried. {type(err).__name__}: {err}')
+                failures.append({'itemIdentifier': message_id})
+                continue
+
+            try:
+                status_code, msg = self._processor.process_order(
+                    order, tracking_id, StagePipeline.deadline_from_context(context)
+                )
+            except Exception as err:
+                status_code, msg = 500, f'{type(err).__name__}: {err}'
+
+            if status_code >= 500:
+                if self._processor.payment_confirmation is not None:
+                    # The confirmation is on the claimed order, the retry fulfils it without charging again
+                    print(f'Order {tracking_id} was charged ({self._processor.payment_confirmation}) but failed, will be retried.')
+                    Metrics.put_metric('ChargedOrderRetries', 1)
+                print(f'Order {tracking_id} failed, will be retried. {msg}')
+                failures.append({'itemIdentifier': message_id})
+            elif status_code >= 400:
+                print(f'Order {tracking_id} rejected. {msg}')
+
+        return {'batchItemFailures': failures}
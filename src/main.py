@@ -1,11 +1,30 @@
+from os import environ
+
 from router import Router
+from handlers.order_queue_handler import OrderQueueHandler
+from services.inventory_service import InventoryManagingService
+from utils.database_provider import DatabaseProvider
 
 def lambda_handler(event, context):
     response = Router.route(event, context)
 
-    response['headers'] = {
+    response.setdefault('headers', {}).update({
         'Access-Control-Allow-Origin': '*',  # Required for CORS support to work
         'Access-Control-Allow-Credentials': True  # Required for cookies, authorization headers with HTTPS
-    }
+    })
 
     return response
+
+
+def order_worker_handler(event, context):
+    """Processes a batch of orders from the order queue. Meant to be triggered by the SQS queue."""
+    engine = DatabaseProvider(environ.get('toast_db_conn_str')).get_engine()
+    return OrderQueueHandler(engine).handle_batch(event, context)
+
+
+def inventory_snapshot_handler(event, context):
+    """Rebuilds the inventory snapshot. Meant to be invoked on a schedule (e.g. an EventBridge rule)."""
+    engine = DatabaseProvider(environ.get('toast_db_conn_str')).get_engine()
+    version = InventoryManagingService(engine).build_snapshot()
+    print(f'Inventory snapshot {version} written.')
+    return {'version': version}
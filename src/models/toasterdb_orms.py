@@ -1,4 +1,4 @@
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index
 from sqlalchemy.types import DECIMAL, INT, VARCHAR
 from sqlalchemy.orm import relationship, DeclarativeBase
 
@@ -11,10 +11,17 @@ class CustomerOrder(Base):
     id = Column(INT, primary_key=True, autoincrement=True)
     customer_name = Column(VARCHAR(50), nullable=False)
     status = Column(VARCHAR(255), nullable=True)
-    payment_confirmation_id = Column(VARCHAR(37), nullable=False)
+    # NULL while a queued order is Pending (claimed, not charged yet) or was Cancelled before payment
+    payment_confirmation_id = Column(VARCHAR(37), nullable=True)
+    tracking_id = Column(VARCHAR(36), nullable=True, unique=True)
 
     line_items = relationship("CustomerOrderLineItem", back_populates="customer_order")
 
+    __table_args__ = (
+        # Orders by customer, paginated by ID
+        Index('ix_customer_order_customer_name_id', 'customer_name', 'id'),
+    )
+
 
 class CustomerOrderLineItem(Base):
     __tablename__ = 'CUSTOMER_ORDER_LINE_ITEM'
@@ -23,7 +30,11 @@ class CustomerOrderLineItem(Base):
     customer_order_id = Column(INT, ForeignKey('CUSTOMER_ORDER.id'), nullable=False)
     item_id = Column(INT, ForeignKey('INVENTORY.item_id'), nullable=False)
     quantity = Column(INT, nullable=False)
+    # Price paid per unit. NULL for line items recorded before it was stored.
+    unit_price = Column(DECIMAL(9, 2), nullable=True)
 
+    # No explicit indexes on customer_order_id (eager loading of orders) and item_id (inventory stats):
+    # InnoDB already indexes foreign key columns, another index would only slow down inserts
     customer_order = relationship("CustomerOrder", back_populates="line_items")
     inventory_item = relationship("Inventory", back_populates="line_items")
 
@@ -39,6 +50,11 @@ class Inventory(Base):
 
     line_items = relationship("CustomerOrderLineItem", back_populates="inventory_item")
 
+    __table_args__ = (
+        # Lookups and prefix searches by name
+        Index('ix_inventory_item_name', 'item_name'),
+    )
+
 
 class BusinessInfo(Base):
     __tablename__ = 'BUSINESS_INFO'
@@ -1,15 +1,17 @@
-from json import dumps
 from os import environ
 
 from handlers.inventory_management_handler import InventoryManagementHandler
 from handlers.order_processing_handler import OrderProcessingHandler
 from utils.database_provider import DatabaseProvider
+from utils.response_serializer import ResponseSerializer
 
 class Router(object):
     _routes = {
         'inventory-management': InventoryManagementHandler,
         'order-processing': OrderProcessingHandler
     }
+    # Replace to change how response bodies are encoded
+    _serializer: ResponseSerializer = ResponseSerializer.default()
     
     @staticmethod
     def route(event: dict, context) -> dict:
@@ -26,22 +28,28 @@ class Router(object):
         Returns
         -------
         dict
-            A dictionary with the HTTP status code and a body.
+            A dictionary with the HTTP status code, a body and the headers set by the handler, if any.
         """
         env_var_name = 'toast_db_conn_str'
         conn_str = environ.get(env_var_name)
 
+        headers = {}
         resource: str = event['resource']
         parent_resource = resource.split('/')[1]
         if parent_resource and parent_resource in Router._routes:
             handler = Router._routes[parent_resource](DatabaseProvider(conn_str).get_engine())
 
-            status, body = handler.handle_request(event, context)
+            result = handler.handle_request(event, context)
+            if len(result) == 3:
+                status, body, headers = result
+            else:
+                status, body = result
         else:
             status = 404
             body = f'Resource unknown: {resource}'
         
         return {
             'statusCode': status,
-            'body': dumps(body)
+            'body': Router._serializer.dumps(body),
+            'headers': dict(headers)
         }
@@ -1,26 +1,48 @@
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Iterable, Iterator
+
 import sqlalchemy as sa
 import pandas as pd
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
 
 from utils.database_provider import DatabaseProvider
+from utils.inventory_snapshot import InventorySnapshot
+from utils.retry_policy import RetryPolicy
 from models.toasterdb_orms import *
 
 class InventoryManagingService(object):
     """Handles Inventory management related requests."""
     _db: sa.engine.Engine
+    _snapshot: InventorySnapshot | None
+    _retry_policy: RetryPolicy
+
+    IMPORT_FORMATS = {'csv', 'jsonl'}
+    # Caps the errors returned by an import so a bad file can't blow up the response
+    _MAX_REPORTED_IMPORT_ERRORS = 1000
 
-    def __init__(self, db_engine: sa.engine.Engine):
+    def __init__(self, db_engine: sa.engine.Engine, snapshot: InventorySnapshot | None = None):
         """
         Parameters
         ----------
         db_engine : SQLAlchemy.engine.Engine
             The engine to connect to the database with the INVENTORY table to manage.
+        snapshot : InventorySnapshot | None = None
+            The inventory snapshot to serve full listings from.
+            Defaults to the snapshot configured in the environment, if any.
         """
         self._engine = db_engine
+        self._snapshot = snapshot if snapshot is not None else InventorySnapshot.from_environment()
+        self._retry_policy = RetryPolicy('inventory_import')
 
 
     def get_inventory(self, only_in_stock: bool = False) -> pd.DataFrame:
         """
         Retrieves all items in inventory.
+        Served from the inventory snapshot when it is fresh enough, from the database otherwise.
 
         Parameters
         ----------
@@ -32,12 +54,39 @@ class InventoryManagingService(object):
         pandas.Dataframe
             A DataFrame of the data retrieved.
         """
+        if self._snapshot is not None:
+            catalog = self._snapshot.read()
+            if catalog is not None:
+                if only_in_stock:
+                    return catalog[catalog[Inventory.stock_quantity.name] > 0].reset_index(drop=True)
+                return catalog
+
         sql = sa.select(Inventory)
         if only_in_stock:
             sql = sa.select(Inventory).where(Inventory.stock_quantity > 0)
         return DatabaseProvider.pandas_read_sql(self._engine, sql)
 
 
+    def build_snapshot(self) -> str:
+        """
+        Exports the full inventory catalog from the database to the inventory snapshot.
+
+        Returns
+        -------
+        str
+            The version of the snapshot written.
+
+        Raises
+        ------
+        ValueError
+            If no inventory snapshot is configured.
+        """
+        if self._snapshot is None:
+            raise ValueError('No inventory snapshot configured.')
+        catalog = DatabaseProvider.pandas_read_sql(self._engine, sa.select(Inventory).order_by(Inventory.item_id))
+        return self._snapshot.write(catalog)
+
+
     def get_item_by_id(self, id: int) -> pd.DataFrame:
         """
         Retrieves item in inventory based on item ID.
@@ -74,6 +123,34 @@ class InventoryManagingService(object):
         return DatabaseProvider.pandas_read_sql(self._engine, sql)
 
 
+    def search_items_by_name(self, prefix: str, limit: int = 20) -> pd.DataFrame:
+        """
+        Retrieves items in inventory whose name starts with a prefix, case-insensitively.
+
+        The query is a ``LIKE 'prefix%'`` so it can use the index on `Inventory.item_name`.
+        Case-insensitivity comes from the column's collation (MySQL's default collations are
+        case-insensitive); wrapping the column in ``LOWER()`` would prevent the index from being used.
+
+        Parameters
+        ----------
+        prefix : str
+            The prefix of the item names.
+        limit : int = 20
+            The maximum number of items to retrieve.
+
+        Returns
+        -------
+        pandas.DataFrame
+            A DataFrame of the items found, ordered by name.
+        """
+        # Escape LIKE wildcards so they match literally
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        sql = sa.select(Inventory).where(
+            Inventory.item_name.like(pattern, escape='\\')
+        ).order_by(Inventory.item_name, Inventory.item_id).limit(limit)
+        return DatabaseProvider.pandas_read_sql(self._engine, sql)
+
+
     def item_enough_stock(self, item_id: int | str, quantity: int | str) -> bool:
         """
         Determines if an has enough stock quantity.
@@ -96,4 +173,404 @@ class InventoryManagingService(object):
         )
         df = DatabaseProvider.pandas_read_sql(self._engine, sql)
         return not df.empty
-    
\ No newline at end of file
+
+
+    def get_inventory_stats(self, low_stock_threshold: int = 10, window_orders: int = 1000, top: int = 100) -> dict:
+        """
+        Computes inventory analytics. All aggregation, filtering and ranking is done by the database
+        so at most `top` rows per list are transferred, no matter how large the catalog or the
+        order history is. Derived metrics are computed over that small result with vectorized pandas operations.
+
+        Orders don't carry a timestamp, so sales velocity is measured over the most recent
+        `window_orders` orders instead of a time window, and cover is expressed in orders.
+
+        Parameters
+        ----------
+        low_stock_threshold : int = 10
+            Items with a stock quantity below this are reported as low in stock.
+        window_orders : int = 1000
+            The number of most recent orders to compute sales velocity over.
+        top : int = 100
+            The maximum number of items in ``low_stock_items`` and in ``items``.
+
+        Returns
+        -------
+        dict
+            A dictionary with the following keys:
+            ``total_stock_value``, ``total_stock_quantity``, ``item_count``, ``orders_in_window``,
+            ``low_stock_count``, ``low_stock_items`` (lowest stock first),
+            ``items_sold_count`` and ``items``.
+            ``items`` only has items that sold in the window, those running out soonest first.
+            Each entry contains the item's units sold in the window, its sales velocity (units per order)
+            and its orders of cover.
+        """
+        totals_sql = sa.select(
+            sa.func.coalesce(sa.func.sum(Inventory.unit_price * Inventory.stock_quantity), 0).label('total_stock_value'),
+            sa.func.coalesce(sa.func.sum(Inventory.stock_quantity), 0).label('total_stock_quantity'),
+            sa.func.count(Inventory.item_id).label('item_count')
+        )
+        # Not through pandas, which would read the DECIMAL total as a float
+        totals = DatabaseProvider.query_db(self._engine, totals_sql)[0]
+
+        is_low_stock = Inventory.stock_quantity < low_stock_threshold
+        low_stock_count = DatabaseProvider.query_db(
+            self._engine, sa.select(sa.func.count()).select_from(Inventory).where(is_low_stock)
+        )[0][0]
+        low_stock_sql = sa.select(
+            Inventory.item_id, Inventory.item_name, Inventory.stock_quantity
+        ).where(is_low_stock).order_by(Inventory.stock_quantity, Inventory.item_id).limit(top)
+        low_stock_df = DatabaseProvider.pandas_read_sql(self._engine, low_stock_sql)
+
+        # The window is the last `window_orders` order IDs, found through the primary key index
+        window_start = (
+            sa.select(CustomerOrder.id)
+            .order_by(CustomerOrder.id.desc())
+            .limit(1)
+            .offset(window_orders - 1)
+            .scalar_subquery()
+        )
+        orders_in_window_sql = sa.select(sa.func.count()).select_from(
+            sa.select(CustomerOrder.id).order_by(CustomerOrder.id.desc()).limit(window_orders).subquery()
+        )
+        orders_in_window = DatabaseProvider.query_db(self._engine, orders_in_window_sql)[0][0]
+
+        sales = (
+            sa.select(
+                CustomerOrderLineItem.item_id,
+                sa.func.sum(CustomerOrderLineItem.quantity).label('units_sold')
+            )
+            .where(CustomerOrderLineItem.customer_order_id >= sa.func.coalesce(window_start, 0))
+            .group_by(CustomerOrderLineItem.item_id)
+            .subquery()
+        )
+        items_sold_count = DatabaseProvider.query_db(
+            self._engine, sa.select(sa.func.count()).select_from(sales)
+        )[0][0]
+        # Cover is proportional to stock / units sold, rank by it so the top items are the most urgent ones
+        velocity_sql = sa.select(
+            Inventory.item_id,
+            Inventory.item_name,
+            Inventory.stock_quantity,
+            sales.c.units_sold
+        ).join(
+            sales, sales.c.item_id == Inventory.item_id
+        ).order_by(
+            (Inventory.stock_quantity * 1.0 / sales.c.units_sold).asc(), Inventory.item_id
+        ).limit(top)
+        items_df = DatabaseProvider.pandas_read_sql(self._engine, velocity_sql)
+
+        # An empty result (nothing sold in the window) has object columns, which can't be rounded
+        items_df = items_df.astype({'stock_quantity': 'int64', 'units_sold': 'int64'})
+        items_df['velocity_per_order'] = items_df['units_sold'] / max(orders_in_window, 1)
+        items_df['orders_of_cover'] = (items_df['stock_quantity'] / items_df['velocity_per_order']).round(1)
+        items_df['velocity_per_order'] = items_df['velocity_per_order'].round(4)
+
+        return {
+            'total_stock_value': totals.total_stock_value,
+            'total_stock_quantity': int(totals.total_stock_quantity),
+            'item_count': int(totals.item_count),
+            'orders_in_window': int(orders_in_window),
+            'low_stock_count': int(low_stock_count),
+            'low_stock_items': low_stock_df.to_dict('records'),
+            'items_sold_count': int(items_sold_count),
+            'items': items_df.to_dict('records')
+        }
+
+
+    def import_inventory(self, lines: Iterable[str], format: str, batch_size: int = 1000) -> dict:
+        """
+        Imports item upserts and stock adjustments. The rows are parsed lazily and applied
+        in batches, each batch in its own transaction with one multi-row statement per kind of change,
+        so memory use and transaction size stay bounded no matter how large the import is.
+        Deadlocks and lock wait timeouts are retried according to `self._retry_policy`.
+
+        Each row is either:
+        - an upsert: ``item_name``, ``unit_price``, ``stock_quantity``, ``weight`` and optionally ``item_id``.
+          Rows with an ``item_id`` update that item (or insert it with that ID).
+          Rows without one are matched on ``item_name``, case-insensitively: they update the item with
+          that name, or insert a new item if there is none. So re-importing the same file doesn't
+          duplicate items. Rows whose name matches several items are rejected.
+        - a stock adjustment: ``item_id`` and ``stock_delta``, which is added to the item's stock quantity.
+          Adjustments that would make the stock quantity negative are rejected.
+
+        Parameters
+        ----------
+        lines : Iterable[str]
+            The lines of the import. For CSV, the first line is the header.
+        format : str
+            The format of the import, either ``csv`` or ``jsonl`` (one JSON object per line).
+        batch_size : int = 1000
+            The number of rows applied per transaction.
+
+        Returns
+        -------
+        dict
+            A summary with ``rows_processed``, ``items_upserted``, ``stock_adjusted``, ``error_count``
+            and ``errors``, a list of the rows (1-based) that were not applied and why.
+
+        Raises
+        ------
+        ValueError
+            If the format is not supported.
+        """
+        if format not in self.IMPORT_FORMATS:
+            raise ValueError(f'Unsupported import format "{format}".')
+
+        summary = {
+            'rows_processed': 0,
+            'items_upserted': 0,
+            'stock_adjusted': 0,
+            'error_count': 0,
+            'errors': []
+        }
+        rows = self.__parse_import_rows__(lines, format)
+        while batch := list(islice(rows, batch_size)):
+            self.__apply_import_batch__(batch, summary)
+
+        if self._snapshot is not None and (summary['items_upserted'] or summary['stock_adjusted']):
+            # Keep full listings consistent with the import instead of waiting for the next scheduled rebuild.
+            # The import is already committed, a failure here must not make it look like it failed.
+            try:
+                self.build_snapshot()
+            except Exception as err:
+                print(f'Could not rebuild inventory snapshot after import. {type(err).__name__}: {err}')
+
+        return summary
+
+
+    @staticmethod
+    def __parse_import_rows__(lines: Iterable[str], format: str) -> Iterator[tuple[int, dict | None, str | None]]:
+        """
+        Lazily parses and validates the import rows.
+
+        Yields
+        ------
+        tuple[int, dict | None, str | None]
+            The row number, the validated row (None if invalid) and the validation error (None if valid).
+        """
+        # CSV rows are numbered from the first data row, JSON lines by line (blank lines are skipped)
+        records = csv.DictReader(lines) if format == 'csv' else lines
+        parse_int = InventoryManagingService.__parse_import_int__
+        parse_decimal = InventoryManagingService.__parse_import_decimal__
+
+        for row_number, record in enumerate(records, start=1):
+            if format == 'jsonl' and not record.strip():
+                continue
+            try:
+                if format == 'jsonl':
+                    record = json.loads(record)
+                    if not isinstance(record, dict):
+                        raise ValueError('row is not a JSON object')
+                # Empty CSV cells mean the column is not provided
+                record = {k: v for k, v in record.items() if k is not None and v not in ('', None)}
+
+                if 'stock_delta' in record:
+                    row = {
+                        Inventory.item_id.name: parse_int(record, Inventory.item_id.name, 1),
+                        'stock_delta': parse_int(record, 'stock_delta')
+                    }
+                else:
+                    item_name = str(record[Inventory.item_name.name]).strip()
+                    if not item_name:
+                        raise ValueError('item_name must not be blank')
+                    if len(item_name) > Inventory.item_name.type.length:
+                        raise ValueError('item_name is too long')
+                    row = {
+                        Inventory.item_id.name: parse_int(record, Inventory.item_id.name, 1) if Inventory.item_id.name in record else None,
+                        Inventory.item_name.name: item_name,
+                        Inventory.unit_price.name: parse_decimal(record, Inventory.unit_price),
+                        Inventory.stock_quantity.name: parse_int(record, Inventory.stock_quantity.name, 0),
+                        Inventory.weight.name: parse_decimal(record, Inventory.weight)
+                    }
+            except KeyError as err:
+                yield row_number, None, f'missing field {err}'
+            except InvalidOperation:
+                yield row_number, None, 'invalid value: not a decimal number'
+            except (ValueError, TypeError) as err:
+                yield row_number, None, f'invalid value: {err}'
+            else:
+                yield row_number, row, None
+
+
+    @staticmethod
+    def __parse_import_int__(record: dict, field: str, minimum: int = -2**31) -> int:
+        """Parses an import field into an integer that fits in a MySQL ``INT`` and is >= `minimum`."""
+        value = record[field]
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError(f'{field} must be an integer')
+        value = int(value)
+        if not minimum <= value < 2**31:
+            raise ValueError(f'{field} must be between {minimum} and {2**31 - 1}')
+        return value
+
+
+    @staticmethod
+    def __parse_import_decimal__(record: dict, column: Column) -> Decimal:
+        """Parses an import field into a non-negative decimal that fits in the ``DECIMAL`` column exactly."""
+        precision, scale = column.type.precision, column.type.scale
+        value = Decimal(str(record[column.name]))
+        if not value.is_finite():
+            raise ValueError(f'{column.name} must be a finite number')
+        if value < 0:
+            raise ValueError(f'{column.name} must not be negative')
+        quantized = value.quantize(Decimal(1).scaleb(-scale))
+        if quantized != value:
+            raise ValueError(f'{column.name} must have at most {scale} decimal places')
+        if quantized >= Decimal(10) ** (precision - scale):
+            raise ValueError(f'{column.name} must be less than {10 ** (precision - scale)}')
+        return quantized
+
+
+    def __apply_import_batch__(self, batch: list[tuple[int, dict | None, str | None]], summary: dict) -> None:
+        """
+        Applies one batch of parsed import rows in a single transaction, updating `summary` in place.
+        The errors of the batch (validation, rejected rows, failed batch) are reported in row order.
+        """
+        upserts, adjustments, errors = [], [], []
+        for row_number, row, error in batch:
+            summary['rows_processed'] += 1
+            if error is not None:
+                errors.append((row_number, error))
+            elif 'stock_delta' in row:
+                adjustments.append((row_number, row))
+            else:
+                upserts.append((row_number, row))
+
+        if upserts or adjustments:
+            try:
+                row_errors, upserted, adjusted = self._retry_policy.run(
+                    lambda: self.__apply_import_transaction__(upserts, adjustments)
+                )
+            except Exception as err:
+                errors += [(row_number, f'batch failed: {type(err).__name__}') for row_number, _ in upserts + adjustments]
+            else:
+                errors += row_errors
+                summary['items_upserted'] += upserted
+                summary['stock_adjusted'] += adjusted
+
+        for row_number, error in sorted(errors, key=lambda error: error[0]):
+            self.__add_import_error__(summary, row_number, error)
+
+
+    def __apply_import_transaction__(self, upserts: list[tuple[int, dict]], adjustments: list[tuple[int, dict]]) -> tuple[list[tuple[int, str]], int, int]:
+        """
+        Runs the transaction of one import batch once. Rolls back and re-raises on any error.
+        Doesn't modify its arguments so it can be retried.
+        Rows are written in ascending `item_id` order, like orders do, to avoid deadlocks.
+
+        Returns
+        -------
+        tuple[list[tuple[int, str]], int, int]
+            The rejected rows (row number, error), the number of upserts and the number of stock adjustments applied.
+        """
+        row_errors = []
+        with Session(self._engine) as session:
+            session.begin()
+            try:
+                # Core statements on the session's connection so lists of parameters run as executemany
+                conn = session.connection()
+
+                upsert_rows = []
+                if upserts:
+                    # Match rows without an ID to existing items by name (the column's collation is case-insensitive)
+                    new_names = {row[Inventory.item_name.name] for _, row in upserts if row[Inventory.item_id.name] is None}
+                    ids_by_name = {}
+                    if new_names:
+                        for item_id, item_name in conn.execute(
+                            sa.select(Inventory.item_id, Inventory.item_name).where(Inventory.item_name.in_(new_names))
+                        ):
+                            ids_by_name.setdefault(item_name.casefold(), []).append(item_id)
+
+                    upsert_rows, row_errors = self.__match_import_upserts__(upserts, ids_by_name)
+
+                if upsert_rows:
+                    sql = mysql_insert(Inventory)
+                    sql = sql.on_duplicate_key_update(
+                        item_name=sql.inserted.item_name,
+                        unit_price=sql.inserted.unit_price,
+                        stock_quantity=sql.inserted.stock_quantity,
+                        weight=sql.inserted.weight
+                    )
+                    # executemany: one round trip per batch instead of per row
+                    conn.execute(sql, upsert_rows)
+
+                stock_deltas = {}
+                if adjustments:
+                    # Lock the rows (in item_id order) so the stock checked is the stock updated
+                    stock = dict(conn.execute(
+                        sa.select(Inventory.item_id, Inventory.stock_quantity).where(
+                            Inventory.item_id.in_({row[Inventory.item_id.name] for _, row in adjustments})
+                        ).order_by(Inventory.item_id).with_for_update()
+                    ).all())
+                    for row_number, row in adjustments:
+                        item_id, delta = row[Inventory.item_id.name], row['stock_delta']
+                        if item_id not in stock:
+                            row_errors.append((row_number, f'no item with ID {item_id}'))
+                        elif stock[item_id] + delta < 0:
+                            row_errors.append((row_number, f'stock_quantity would be negative (currently {stock[item_id]})'))
+                        else:
+                            stock[item_id] += delta
+                            stock_deltas[item_id] = stock_deltas.get(item_id, 0) + delta
+
+                if stock_deltas:
+                    conn.execute(
+                        sa.update(Inventory).where(
+                            (Inventory.item_id == sa.bindparam('b_item_id'))
+                            & (Inventory.stock_quantity + sa.bindparam('b_stock_delta') >= 0)
+                        ).values(stock_quantity=Inventory.stock_quantity + sa.bindparam('b_stock_delta')),
+                        [{'b_item_id': item_id, 'b_stock_delta': delta} for item_id, delta in sorted(stock_deltas.items())]
+                    )
+            except Exception:
+                session.rollback()
+                raise
+            else:
+                session.commit()
+
+        rejected = {row_number for row_number, _ in row_errors}
+        upserted = sum(1 for row_number, _ in upserts if row_number not in rejected)
+        adjusted = sum(1 for row_number, _ in adjustments if row_number not in rejected)
+        return row_errors, upserted, adjusted
+
+
+    @staticmethod
+    def __match_import_upserts__(upserts: list[tuple[int, dict]], ids_by_name: dict[str, list[int]]) -> tuple[list[dict], list[tuple[int, str]]]:
+        """
+        Resolves the item IDs of import upserts without one, based on their name.
+
+        Parameters
+        ----------
+        upserts : list[tuple[int, dict]]
+            The upsert rows, with their row number. Not modified.
+        ids_by_name : dict[str, list[int]]
+            The IDs of the existing items, keyed by case folded name.
+
+        Returns
+        -------
+        tuple[list[dict], list[tuple[int, str]]]
+            The rows to write, updates in ascending `item_id` order followed by inserts (rows for new items,
+            the last row wins if a new name appears several times), and the rejected rows (row number, error).
+        """
+        rows, inserts_by_name, row_errors = [], {}, []
+        for row_number, row in upserts:
+            row = dict(row)
+            if row[Inventory.item_id.name] is None:
+                name = row[Inventory.item_name.name].casefold()
+                matches = ids_by_name.get(name, [])
+                if len(matches) > 1:
+                    row_errors.append((row_number, f'item_name matches several items {sorted(matches)}, use item_id'))
+                    continue
+                if not matches:
+                    # Several rows for the same new item: the last one wins, like updates
+                    inserts_by_name[name] = row
+                    continue
+                row[Inventory.item_id.name] = matches[0]
+            rows.append(row)
+        rows.sort(key=lambda row: row[Inventory.item_id.name])
+        return rows + list(inserts_by_name.values()), row_errors
+
+
+    def __add_import_error__(self, summary: dict, row_number: int, error: str) -> None:
+        """Records an import row error in `summary`, up to the maximum number of reported errors."""
+        summary['error_count'] += 1
+        if len(summary['errors']) < self._MAX_REPORTED_IMPORT_ERRORS:
+            summary['errors'].append({'row': row_number, 'error': error})
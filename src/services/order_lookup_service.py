@@ -0,0 +1,152 @@
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from services.order_processing_service import OrderStatus
+from models.toasterdb_orms import *
+
+class OrderLookupService(object):
+    """
+    Handles reading orders back from the database.
+    Orders are loaded with their line items and item details eagerly, in a fixed number of queries
+    (one for the orders, one for the line items joined with their inventory items), regardless of
+    how many orders or line items there are.
+    """
+    _engine: sa.engine.Engine
+
+    def __init__(self, engine: sa.engine.Engine):
+        """
+        Parameters
+        ----------
+        engine : SQLAlchemy.engine.Engine
+            The engine to connect to the database with the orders.
+        """
+        self._engine = engine
+
+
+    def get_order_by_id(self, id: int) -> dict | None:
+        """
+        Retrieves an order with its line items.
+
+        Parameters
+        ----------
+        id : int
+            The ID (confirmation number) of the order.
+
+        Returns
+        -------
+        dict | None
+            The order found, or None if there is no order with that ID.
+        """
+        sql = self.__order_select__().where(CustomerOrder.id == id)
+        with Session(self._engine) as session:
+            order = session.scalars(sql).first()
+            return self.__order_to_dict__(order) if order is not None else None
+
+
+    def get_order_by_tracking_id(self, tracking_id: str) -> dict | None:
+        """
+        Retrieves an order with its line items based on the tracking ID it was accepted with.
+
+        Parameters
+        ----------
+        tracking_id : str
+            The tracking ID returned when the order was accepted.
+
+        Returns
+        -------
+        dict | None
+            The order found, or None if no worker picked the order up yet. An order being processed
+            is Pending (without line items), an order rejected for stock or payment is Cancelled.
+        """
+        sql = self.__order_select__().where(CustomerOrder.tracking_id == tracking_id)
+        with Session(self._engine) as session:
+            order = session.scalars(sql).first()
+            return self.__order_to_dict__(order) if order is not None else None
+
+
+    def get_orders_by_customer(self, customer_name: str, limit: int = 20, after_id: int | None = None) -> tuple[list[dict], int | None]:
+        """
+        Retrieves a page of orders placed by a customer, ordered by order ID.
+        Uses keyset pagination so later pages cost the same as the first one.
+
+        Parameters
+        ----------
+        customer_name : str
+            The name of the customer who placed the orders.
+        limit : int = 20
+            The maximum number of orders to retrieve.
+        after_id : int | None = None
+            Only orders with an ID greater than this are retrieved.
+            Pass the cursor returned with the previous page to get the next one.
+
+        Returns
+        -------
+        tuple[list[dict], int | None]
+            The orders found and the cursor of the next page, or None if this is the last page.
+        """
+        sql = self.__order_select__().where(CustomerOrder.customer_name == customer_name)
+        if after_id is not None:
+            sql = sql.where(CustomerOrder.id > after_id)
+        # Fetch one extra row to know whether there's a next page without a COUNT query
+        sql = sql.order_by(CustomerOrder.id).limit(limit + 1)
+
+        with Session(self._engine) as session:
+            orders = session.scalars(sql).all()
+            has_next = len(orders) > limit
+            orders = [self.__order_to_dict__(order) for order in orders[:limit]]
+
+        next_cursor = orders[-1]['order_id'] if has_next else None
+        return orders, next_cursor
+
+
+    @staticmethod
+    def is_terminal(order: dict) -> bool:
+        """
+        Determines if an order is in a status that won't change anymore.
+
+        Parameters
+        ----------
+        order : dict
+            The order, as returned by this service.
+
+        Returns
+        -------
+        bool
+            True if the order is complete or cancelled, False otherwise.
+        """
+        return order['status'] in {OrderStatus.COMPLETE.value, OrderStatus.CANCELLED.value}
+
+
+    @staticmethod
+    def __order_select__() -> sa.Select:
+        """Builds the base SELECT for orders, eagerly loading line items and their inventory items."""
+        return sa.select(CustomerOrder).options(
+            selectinload(CustomerOrder.line_items).joinedload(CustomerOrderLineItem.inventory_item)
+        )
+
+
+    @staticmethod
+    def __order_to_dict__(order: CustomerOrder) -> dict:
+        """
+        Converts a loaded order into a JSON serializable dictionary.
+        ``unit_price`` is the price paid, as recorded with the line item (None for line items recorded
+        before prices were stored), never the current inventory price, so terminal orders stay immutable.
+        It's kept as a ``Decimal``, which the response serializer writes as a number with the same digits.
+        The payment confirmation is left out: orders are looked up by unauthenticated endpoints.
+        """
+        return {
+            'order_id': order.id,
+            'customer_name': order.customer_name,
+            'status': order.status,
+            'tracking_id': order.tracking_id,
+            'line_items': [
+                {
+                    'line_item_id': line_item.id,
+                    'item_id': line_item.item_id,
+                    'item_name': line_item.inventory_item.item_name,
+                    'unit_price': line_item.unit_price,
+                    'quantity': line_item.quantity
+                }
+                for line_item in sorted(order.line_items, key=lambda line_item: line_item.id)
+            ]
+        }
@@ -1,3 +1,5 @@
+import time
+from decimal import Decimal
 from enum import Enum
 
 import boto3
@@ -8,9 +10,13 @@ from sqlalchemy.orm import Session
 import json
 
 from utils.database_provider import DatabaseProvider
+from utils.retry_policy import RetryPolicy
+from utils.stage_pipeline import Stage, StagePipeline, StageFailedError, StageTimeoutError
 from models.toasterdb_orms import *
 
 class OrderStatus(Enum):
+    # A queued order whose tracking ID was claimed by a worker, not fulfilled yet
+    PENDING = 'Pending'
     RECEIVED = 'Received'
     IN_PROGRESS = 'Processed'
     SHIPPED = 'Shipped'
@@ -21,9 +27,10 @@ class OrderStatus(Enum):
 class OrderProcessingService(object):
     """Handles order processing for a singular order."""
     _engine: sa.engine.Engine
+    _retry_policy: RetryPolicy
 
     _raw_order: dict
-    _business_info :dict
+    _business_info: dict = None
 
     _order_df: pd.DataFrame = None
     _order_items_df: pd.DataFrame = None
@@ -31,6 +38,13 @@ class OrderProcessingService(object):
     _order_id: int = None
     _payment_confirmation: str = None
 
+    # Timeouts (seconds) of the checkout stages
+    _STOCK_CHECK_TIMEOUT = 5
+    _DB_READ_TIMEOUT = 5
+    _PAYMENT_TIMEOUT = 10
+    # Stock checks run concurrently in at most this many stages, less than `StagePipeline.MAX_WORKERS`
+    _MAX_STOCK_CHECK_STAGES = 4
+
     def __init__(self, engine: sa.engine.Engine):
         """
         Parameters
@@ -39,14 +53,24 @@ class OrderProcessingService(object):
             The engine to connect to the database to handle the order.
         """
         self._engine = engine
-        self.__get_business_shipping_info__()
+        self._retry_policy = RetryPolicy('order_transaction')
+
+
+    @property
+    def payment_confirmation(self) -> str | None:
+        """The payment confirmation of the last order processed, None if it wasn't charged."""
+        return self._payment_confirmation
 
 
-    def process_order(self, order: dict) -> tuple[int, str | int]:
+    def process_order(self, order: dict, tracking_id: str | None = None, deadline: float | None = None) -> tuple[int, str | int]:
         """
         Processes an order with the ordered items, payment info, and shipping info.
         Updates the database as neccessary.
 
+        The checks before payment run as stages with declared dependencies (see `__checkout_stages__`),
+        concurrently where they are independent. The payment itself is not a stage: it runs once they
+        are all done, and is never abandoned once started.
+
         Parameters
         ----------
         order : dict
@@ -82,6 +106,14 @@ class OrderProcessingService(object):
                 }
             }
             ```
+        tracking_id : str | None = None
+            The tracking ID given to the order when it was accepted, if it was processed asynchronously.
+            A Pending order is recorded under it before payment, so a redelivered order is charged at
+            most once (the tracking ID is also sent to the payment service as the idempotency key) and
+            fulfilled at most once. Orders rejected for stock or payment are marked Cancelled.
+        deadline : float | None = None
+            The ``time.monotonic()`` value by which the checkout stages need to be done, if any.
+            Payment isn't started past it. See `StagePipeline.deadline_from_context`.
         
         Returns
         -------
@@ -89,31 +121,62 @@ class OrderProcessingService(object):
             A an HTTP response status code and a message. If no error, message is confirmation number.
         """
         self._raw_order = order
+        # The service may process several orders in a row (e.g. a queue batch), don't carry state over
+        self._order_df = None
+        self._order_items_df = None
+        self._order_id = None
+        self._payment_confirmation = None
+
+        if tracking_id is not None:
+            # Queued orders are delivered at least once: claim the tracking ID before anything is charged
+            try:
+                self._order_id, status, self._payment_confirmation = self.__claim_order__(tracking_id)
+            except Exception as err:
+                return 500, f'An error occurred when claiming order. {type(err).__name__}'
+            if status == OrderStatus.CANCELLED.value:
+                return 409, 'Order was already rejected.'
+            if status != OrderStatus.PENDING.value:
+                return 200, self._order_id
+
+        try:
+            results = StagePipeline.run(self.__checkout_stages__(), deadline)
+        except StageTimeoutError as err:
+            return 504, f'Timed out when processing order. {err}'
+        except StageFailedError as err:
+            return 500, f'An error occurred when processing order. {type(err.__cause__).__name__}'
+
+        # A paid order is fulfilled even if the stock changed since, the charge can't be taken back here
+        if self._payment_confirmation is None:
+            if not results['in_stock']:
+                self.__cancel_claimed_order__()
+                return 409, 'Not enough items in stock.' # Conflict
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return 504, 'Timed out when processing order, payment was not attempted.'
 
-        if not self.__in_stock__():
-            # Item not in stock, return -1 to indicate it
-            return 409, 'Not enough items in stock.' # Conflict
-        
         try:
-            self.__process_payment__()
-            if not self._payment_confirmation:
-                return 400, 'Could not process payment method, please try again.'
+            if self._payment_confirmation is None:
+                # Bounded only by the payment request timeout: abandoning a charge could charge a card without an order
+                self._payment_confirmation = self.__process_payment__(results['unit_prices'], tracking_id)
+                if not self._payment_confirmation:
+                    self.__cancel_claimed_order__()
+                    return 400, 'Could not process payment method, please try again.'
+                if self._order_id is not None:
+                    self.__update_claimed_order__(payment_confirmation_id=self._payment_confirmation)
             # TODO: bring back
             #self.__process_shipping__()
 
-            self._order_id = DatabaseProvider.query_db(
-                self._engine,
-                sa.select(sa.func.ifnull(sa.func.max(CustomerOrder.id), 0) + 1)
-            )[0][0]
-            
+            # The order ID is generated by the database when the order is inserted (or claimed)
             self._order_df = pd.DataFrame({
-                CustomerOrder.id.name: [self._order_id],
                 CustomerOrder.customer_name.name: [order['payment_info']['name']],
                 CustomerOrder.status.name: [OrderStatus.RECEIVED.value],
                 CustomerOrder.payment_confirmation_id.name: self._payment_confirmation
             })
+            # Only queued orders write the tracking ID, synchronous orders work on a schema without it
+            if tracking_id is not None:
+                self._order_df[CustomerOrder.tracking_id.name] = tracking_id
 
-            self.__process_order_items__()
+            self.__process_order_items__(results['unit_prices'])
         except Exception as err:
             return 500, f'An error occurred when processing order. {type(err).__name__}'
         
@@ -123,57 +186,126 @@ class OrderProcessingService(object):
         return 200, self._order_id
     
 
-    def __process_order_items__(self):
+    def __checkout_stages__(self) -> list[Stage]:
+        """
+        Builds the checkout stages of the current order.
+
+        ```
+        stock_<n> (at most _MAX_STOCK_CHECK_STAGES) --> in_stock
+        unit_prices
+        ```
+        The items are spread over a bounded number of stock stages, each checking its items one after
+        another, so a large order doesn't take over the stage thread pool.
+
+        Returns
+        -------
+        list[Stage]
+            The stages, to be run by `StagePipeline.run`.
+        """
+        items = self._raw_order['items']
+        partitions = [items[i::self._MAX_STOCK_CHECK_STAGES] for i in range(min(len(items), self._MAX_STOCK_CHECK_STAGES))]
+        stock_stages = [
+            Stage(
+                f'stock_{i}',
+                lambda _, partition=partition: all(self.__item_in_stock__(item) for item in partition),
+                timeout=self._STOCK_CHECK_TIMEOUT * len(partition)
+            )
+            for i, partition in enumerate(partitions)
+        ]
+        return stock_stages + [
+            Stage(
+                'in_stock',
+                lambda results: all(results.values()),
+                depends_on=[stage.name for stage in stock_stages]
+            ),
+            Stage('unit_prices', lambda _: self.__get_unit_prices__(), timeout=self._DB_READ_TIMEOUT)
+        ]
+
+
+    def __process_order_items__(self, unit_prices: dict[int, Decimal]):
         """
         Processes all the items in the order.
-        Creates a DataFrame of the order with item_id and corresponding quantity.
+        Creates a DataFrame of the order with item_id, corresponding quantity and the unit price charged.
+        The order ID is added when the order is inserted.
+
+        Parameters
+        ----------
+        unit_prices : dict[int, Decimal]
+            The unit price charged for every item in the order, keyed by item ID.
         """
         items = self._raw_order['items']
         items_data = {
-            CustomerOrderLineItem.customer_order_id.name: [],
             CustomerOrderLineItem.item_id.name: [],
-            CustomerOrderLineItem.quantity.name: []
+            CustomerOrderLineItem.quantity.name: [],
+            CustomerOrderLineItem.unit_price.name: []
         }
 
         # Add each item to data list to make df
         for item in items:
-            items_data[CustomerOrderLineItem.customer_order_id.name].append(self._order_id)
             items_data[CustomerOrderLineItem.item_id.name].append(item['item_id'])
             items_data[CustomerOrderLineItem.quantity.name].append(item['quantity'])
+            items_data[CustomerOrderLineItem.unit_price.name].append(unit_prices[item['item_id']])
 
         self._order_items_df = pd.DataFrame(items_data)
 
-    def __process_payment__(self):
+    def __get_unit_prices__(self) -> dict[int, Decimal]:
         """
-        Process payment information from order. If payment info does not already exist in database,
-        sets `self._payment_df` with `pandas.DataFrame` of the payment info. Also sets `self._payment_info_id`
-        with the existing payment info in database or new one that's going to be inserted.
+        Retrieves the unit price of every item in the order with a single query.
+
+        Returns
+        -------
+        dict[int, Decimal]
+            The unit prices (exact, as stored), keyed by item ID. Items that don't exist are left out.
+        """
+        item_ids = {item['item_id'] for item in self._raw_order['items']}
+        rows = DatabaseProvider.query_db(
+            self._engine,
+            sa.select(Inventory.item_id, Inventory.unit_price).where(Inventory.item_id.in_(item_ids))
+        )
+        return {item_id: unit_price for item_id, unit_price in rows}
+
+
+    def __process_payment__(self, unit_prices: dict[int, Decimal], idempotency_key: str | None = None) -> str | None:
+        """
+        Charges the order total through the payment service.
+
+        Parameters
+        ----------
+        unit_prices : dict[int, Decimal]
+            The unit price of every item in the order, keyed by item ID.
+        idempotency_key : str | None = None
+            Sent with the charge so the payment service doesn't charge twice for the same key
+            (e.g. when a queued order is redelivered after its charge went through).
+
+        Returns
+        -------
+        str | None
+            The payment confirmation number, or None if the payment was declined.
         """
         URL = 'https://1zpl4u5btg.execute-api.us-east-2.amazonaws.com/Test/payment'
         items = self._raw_order['items']
-        total_cost = 0
+        total_cost = Decimal(0)
         
         for item in items:
-            sql = sa.select(Inventory).where(Inventory.item_id == item['item_id'])
-
-            inv_item: pd.DataFrame = DatabaseProvider.pandas_read_sql(self._engine, sql)
-            unit_price = inv_item.loc[0, Inventory.unit_price.name]
-            total_cost += item['quantity'] * unit_price
+            total_cost += item['quantity'] * unit_prices[item['item_id']]
 
         body = {
             'payment_info': self._raw_order['payment_info'],
             'transaction': {
-                'amount': total_cost,
+                # Summed exactly, converted only for the JSON request
+                'amount': float(total_cost),
                 'type': 'purchase'
             }
         }
+        if idempotency_key is not None:
+            body['idempotency_key'] = idempotency_key
 
-        r = requests.post(URL, json=body)
+        r = requests.post(URL, json=body, timeout=self._PAYMENT_TIMEOUT)
         
         if r.status_code != 200:
-            return
+            return None
         
-        self._payment_confirmation = r.json()['confirmation_number']
+        return r.json()['confirmation_number']
         
 
     def __get_business_shipping_info__(self) -> None:
@@ -186,6 +318,8 @@ class OrderProcessingService(object):
         Async process shipment by putting an event on an event bus.
         Sending shipping info (addresses, packets, etc.) to shiping "vendor".
         """
+        if self._business_info is None:
+            self.__get_business_shipping_info__()
         # TODO
         shipment_info = {
             'business_id': self._business_info[BusinessInfo.shipment_business_id.name],
@@ -229,60 +363,167 @@ class OrderProcessingService(object):
         }
     
 
-    def __in_stock__(self) -> bool:
+    def __item_in_stock__(self, item: dict) -> bool:
         """
-        Checks if the items have enough stock quantity based on the order quantity.
+        Checks if an item has enough stock quantity based on the order quantity.
+
+        Parameters
+        ----------
+        item : dict
+            The ordered item, with its ``item_id`` and ``quantity``.
 
         Returns
         -------
         bool
-            True if quantity all items in order are <= the corresponding item stock, False otherwise.
+            True if the quantity ordered is <= the item stock, False otherwise.
         """
-        for item in self._raw_order['items']:
-            res = requests.get(
-                f'https://1zpl4u5btg.execute-api.us-east-2.amazonaws.com/Test/inventory-management/inventory/items/{item['item_id']}'
-            )
+        res = requests.get(
+            f'https://1zpl4u5btg.execute-api.us-east-2.amazonaws.com/Test/inventory-management/inventory/items/{item['item_id']}',
+            timeout=self._STOCK_CHECK_TIMEOUT
+        )
 
-            if res.status_code != 200:
-                return False
-            
-            data = res.json()
-            if data[0]['stock_quantity'] < item['quantity']:
-                return False
-        return True
+        if res.status_code != 200:
+            return False
+        
+        data = res.json()
+        return data[0]['stock_quantity'] >= item['quantity']
     
     
+    def __claim_order__(self, tracking_id: str) -> tuple[int, str, str | None]:
+        """
+        Records a Pending order for a tracking ID, unless there already is an order for it.
+        The tracking ID is unique, so concurrent deliveries of the same order claim the same row.
+
+        Parameters
+        ----------
+        tracking_id : str
+            The tracking ID the order was accepted with.
+
+        Returns
+        -------
+        tuple[int, str, str | None]
+            The ID, status and payment confirmation of the order recorded for the tracking ID.
+        """
+        sql = sa.select(
+            CustomerOrder.id, CustomerOrder.status, CustomerOrder.payment_confirmation_id
+        ).where(CustomerOrder.tracking_id == tracking_id)
+
+        with Session(self._engine) as session:
+            claimed = session.execute(sql).first()
+            if claimed is not None:
+                return tuple(claimed)
+            try:
+                order_id = session.execute(
+                    sa.insert(CustomerOrder).values(
+                        customer_name=self._raw_order['payment_info']['name'],
+                        status=OrderStatus.PENDING.value,
+                        tracking_id=tracking_id
+                    )
+                ).inserted_primary_key[0]
+                session.commit()
+            except sa.exc.IntegrityError:
+                # Claimed by another delivery in the meantime
+                session.rollback()
+                return tuple(session.execute(sql).one())
+        return order_id, OrderStatus.PENDING.value, None
+
+
+    def __update_claimed_order__(self, **values) -> None:
+        """Updates the order claimed for the current tracking ID, if any."""
+        if self._order_id is None:
+            return
+        DatabaseProvider.query_db(
+            self._engine,
+            sa.update(CustomerOrder).where(CustomerOrder.id == self._order_id).values(**values)
+        )
+
+
+    def __cancel_claimed_order__(self) -> None:
+        """
+        Marks the order claimed for the current tracking ID as Cancelled, so its tracking ID reports
+        the rejection. Failures are logged: the order is rejected either way.
+        """
+        try:
+            self.__update_claimed_order__(status=OrderStatus.CANCELLED.value)
+        except Exception as err:
+            print(f'Could not cancel order {self._order_id}. {type(err).__name__}: {err}')
+
+
     def __update_database_with_order__(self) -> bool:
         """
         Makes necessary changes to the database based on the order.
         Inserts payment and shipping info if they are new.
         Inserts order and order items.
         Updates inventory by subtracting the stock quantity by what's ordered.
+        Deadlocks and lock wait timeouts are retried according to `self._retry_policy`.
 
         Returns
         -------
         bool
             An indicator of success. True if transaction was success, False otherwise.
         """
-        session = Session(self._engine)
-        success = True
+        try:
+            self._order_id = self._retry_policy.run(self.__apply_order_transaction__)
+        except Exception as err:
+            print(f'Order transaction failed. {type(err).__name__}: {err}')
+            return False
+        # TODO: Async send shipping info
+        return True
+
+
+    def __apply_order_transaction__(self) -> int:
+        """
+        Runs the order transaction once. Rolls back and re-raises on any error.
+        The order ID is generated by the insert (``AUTO_INCREMENT``), so concurrent orders never
+        collide on it and a retried transaction gets a fresh one.
+        Inventory rows are updated first, in ascending `item_id` order, so concurrent orders take their
+        exclusive row locks in the same order. They are updated before the line items are inserted: the
+        foreign key checks of the insert would otherwise take shared locks on the same rows, and two orders
+        for the same item holding shared locks would deadlock when upgrading them to exclusive locks.
+
+        A claimed order (see `__claim_order__`) is updated instead of inserted, and only while still Pending:
+        if another delivery of the same order fulfilled it first, nothing is changed.
+
+        Returns
+        -------
+        int
+            The ID of the inserted or claimed order.
+        """
+        # Merge duplicate items so each inventory row is locked only once
+        stock_changes = self._order_items_df.groupby(
+            CustomerOrderLineItem.item_id.name, sort=True
+        )[CustomerOrderLineItem.quantity.name].sum()
+
         with Session(self._engine) as session:
             session.begin()
             try:
-                # TODO: get payment confirmation number 
-                session.execute(sa.insert(CustomerOrder).values(self._order_df.to_dict('records')))
-                session.execute(sa.insert(CustomerOrderLineItem).values(self._order_items_df.to_dict('records')))
+                order = self._order_df.to_dict('records')[0]
+                if self._order_id is not None:
+                    order_id = self._order_id
+                    claimed = session.execute(
+                        sa.update(CustomerOrder).where(
+                            CustomerOrder.id == order_id,
+                            CustomerOrder.status == OrderStatus.PENDING.value
+                        ).values(order)
+                    )
+                    if claimed.rowcount == 0:
+                        session.rollback()
+                        return order_id
 
-                for i, row in self._order_items_df.iterrows():
+                for item_id, quantity in stock_changes.items():
                     session.execute(
                         sa.update(Inventory).where(
-                            Inventory.item_id == row[CustomerOrderLineItem.item_id.name]
-                        ).values(stock_quantity=Inventory.stock_quantity - row[CustomerOrderLineItem.quantity.name])
+                            Inventory.item_id == int(item_id)
+                        ).values(stock_quantity=Inventory.stock_quantity - int(quantity))
                     )
-            except Exception as err:
+
+                if self._order_id is None:
+                    order_id = session.execute(sa.insert(CustomerOrder).values(order)).inserted_primary_key[0]
+                line_items = self._order_items_df.assign(**{CustomerOrderLineItem.customer_order_id.name: order_id})
+                session.execute(sa.insert(CustomerOrderLineItem).values(line_items.to_dict('records')))
+            except Exception:
                 session.rollback()
-                success = False
+                raise
             else:
                 session.commit()
-        # TODO: Async send shipping info
-        return success
+        return order_id
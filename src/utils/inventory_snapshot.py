@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from os import environ
+
+import boto3
+import pandas as pd
+
+class InventorySnapshot:
+    """
+    A precomputed, versioned export of the inventory catalog.
+
+    The snapshot is stored as a single file: one JSON header line (version, creation time, row count)
+    followed by the catalog as column-oriented JSON. In production it lives on S3 and is downloaded
+    once per container into ``/tmp``; locally (e.g. in tests) it can be a plain file path.
+    Reading only reads the header line unless the version changed: the parsed catalog is kept
+    in memory until a snapshot with a different version shows up.
+    """
+    URI_ENV_VAR = 'inventory_snapshot_uri'
+    MAX_AGE_ENV_VAR = 'inventory_snapshot_max_age'
+    DEFAULT_MAX_AGE = 300
+
+    # How often (seconds) a container checks S3 for a newer snapshot
+    _S3_CHECK_INTERVAL = 30
+
+    # boto3 clients are expensive to create, share one per container
+    _s3 = None
+
+    # Parsed catalogs shared by every instance in the container: {local path: (version, DataFrame)}
+    _loaded: dict[str, tuple[str, pd.DataFrame]] = {}
+    # Downloaded S3 objects: {uri: (ETag, time of last check)}
+    _downloaded: dict[str, tuple[str, float]] = {}
+
+    _uri: str
+    _max_age: float
+
+    def __init__(self, uri: str, max_age: float = DEFAULT_MAX_AGE):
+        """
+        Parameters
+        ----------
+        uri : str
+            Where the snapshot is stored. Either ``s3://bucket/key`` or a local file path.
+        max_age : float = 300
+            How old (in seconds) a snapshot may be and still be served.
+        """
+        self._uri = uri
+        self._max_age = max_age
+
+
+    @staticmethod
+    def from_environment() -> 'InventorySnapshot | None':
+        """
+        Creates a snapshot from the ``inventory_snapshot_uri`` and ``inventory_snapshot_max_age``
+        environment variables. A malformed max age is logged and replaced by the default.
+
+        Returns
+        -------
+        InventorySnapshot | None
+            The snapshot, or None if no snapshot URI is configured.
+        """
+        uri = environ.get(InventorySnapshot.URI_ENV_VAR)
+        if not uri:
+            return None
+        max_age = environ.get(InventorySnapshot.MAX_AGE_ENV_VAR, InventorySnapshot.DEFAULT_MAX_AGE)
+        try:
+            max_age = float(max_age)
+        except ValueError:
+            print(f'Invalid {InventorySnapshot.MAX_AGE_ENV_VAR} "{max_age}", using {InventorySnapshot.DEFAULT_MAX_AGE}s.')
+            max_age = InventorySnapshot.DEFAULT_MAX_AGE
+        return InventorySnapshot(uri, max_age)
+
+
+    def write(self, catalog: pd.DataFrame) -> str:
+        """
+        Serializes the catalog and stores it as the current snapshot.
+
+        Parameters
+        ----------
+        catalog : pandas.DataFrame
+            The full inventory catalog.
+
+        Returns
+        -------
+        str
+            The version of the snapshot written.
+        """
+        body = json.dumps(catalog.to_dict('list'), separators=(',', ':')).encode()
+        header = {
+            'version': hashlib.sha256(body).hexdigest()[:16],
+            'created_at': time.time(),
+            'row_count': len(catalog)
+        }
+        data = json.dumps(header).encode() + b'\n' + body
+
+        if self.__is_s3__():
+            bucket, key = self.__s3_location__()
+            self.__s3__().put_object(Bucket=bucket, Key=key, Body=data, ContentType='application/json')
+        else:
+            # Write then rename so readers never see a partially written file
+            directory = os.path.dirname(os.path.abspath(self._uri))
+            with tempfile.NamedTemporaryFile(dir=directory, delete=False) as tmp:
+                tmp.write(data)
+            os.replace(tmp.name, self._uri)
+
+        return header['version']
+
+
+    def read(self) -> pd.DataFrame | None:
+        """
+        Retrieves the catalog from the snapshot, if the snapshot is fresh enough.
+
+        Returns
+        -------
+        pandas.DataFrame | None
+            The catalog, or None if the snapshot is missing, unreadable or older than the max age.
+            The catalog is a copy of the one cached by the container, callers may modify it.
+        """
+        try:
+            path = self.__local_path__()
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                if time.time() - header['created_at'] > self._max_age:
+                    return None
+
+                loaded = InventorySnapshot._loaded.get(path)
+                if loaded is not None and loaded[0] == header['version']:
+                    return loaded[1].copy()
+
+                catalog = pd.DataFrame(json.loads(f.read()))
+        except Exception as err:
+            print(f'Could not read inventory snapshot. {type(err).__name__}: {err}')
+            return None
+
+        InventorySnapshot._loaded[path] = (header['version'], catalog)
+        return catalog.copy()
+
+
+    def __local_path__(self) -> str:
+        """
+        Gets the path of the local copy of the snapshot.
+        For S3 snapshots, downloads the object if it changed since it was last downloaded.
+        """
+        if not self.__is_s3__():
+            return self._uri
+
+        bucket, key = self.__s3_location__()
+        path = os.path.join(tempfile.gettempdir(), 'inventory_snapshot_' + hashlib.sha1(self._uri.encode()).hexdigest())
+
+        etag, checked_at = InventorySnapshot._downloaded.get(self._uri, (None, 0.0))
+        if etag is not None and time.time() - checked_at < self._S3_CHECK_INTERVAL:
+            return path
+
+        s3 = self.__s3__()
+        remote_etag = s3.head_object(Bucket=bucket, Key=key)['ETag']
+        if remote_etag != etag:
+            s3.download_file(bucket, key, path + '.part')
+            os.replace(path + '.part', path)
+        InventorySnapshot._downloaded[self._uri] = (remote_etag, time.time())
+        return path
+
+
+    @staticmethod
+    def __s3__():
+        if InventorySnapshot._s3 is None:
+            InventorySnapshot._s3 = boto3.client('s3')
+        return InventorySnapshot._s3
+
+
+    def __is_s3__(self) -> bool:
+        return self._uri.startswith('s3://')
+
+
+    def __s3_location__(self) -> tuple[str, str]:
+        bucket, _, key = self._uri.removeprefix('s3://').partition('/')
+        return bucket, key
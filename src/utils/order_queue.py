@@ -0,0 +1,209 @@
+import base64
+import json
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from os import environ
+from typing import Any
+
+import boto3
+
+class OrderQueue(ABC):
+    """
+    A queue of accepted orders waiting to be processed.
+
+    Messages are JSON objects with the order's ``tracking_id``, the ``order`` without its payment info,
+    and the payment info sealed by the queue (``payment_info``). Card data is never put on the queue
+    in clear: messages stay on the queue (and its dead-letter queue) for days.
+    """
+    URL_ENV_VAR = 'order_queue_url'
+    KMS_KEY_ENV_VAR = 'order_queue_kms_key_id'
+
+    @staticmethod
+    def from_environment() -> 'OrderQueue | None':
+        """
+        Creates the queue configured by the ``order_queue_url`` and ``order_queue_kms_key_id`` environment variables.
+        A queue without a KMS key to seal payment info with is logged and not used.
+
+        Returns
+        -------
+        OrderQueue | None
+            An SQS queue, or None if no queue is configured (orders are then processed synchronously).
+        """
+        url = environ.get(OrderQueue.URL_ENV_VAR)
+        if not url:
+            return None
+        key_id = environ.get(OrderQueue.KMS_KEY_ENV_VAR)
+        if not key_id:
+            print(f'{OrderQueue.URL_ENV_VAR} is set without {OrderQueue.KMS_KEY_ENV_VAR}, processing orders synchronously.')
+            return None
+        return SqsOrderQueue(url, key_id)
+
+
+    def enqueue(self, order: dict) -> str:
+        """
+        Puts an order on the queue, with its payment info sealed.
+
+        Parameters
+        ----------
+        order : dict
+            The validated order.
+
+        Returns
+        -------
+        str
+            The tracking ID of the order.
+        """
+        tracking_id = str(uuid.uuid4())
+        order = dict(order)
+        payment_info = order.pop('payment_info')
+        self._send(json.dumps({
+            'tracking_id': tracking_id,
+            'order': order,
+            'payment_info': self._seal(payment_info)
+        }))
+        return tracking_id
+
+
+    def read(self, body: str) -> tuple[str, dict]:
+        """
+        Reads a message put on the queue by `enqueue`.
+
+        Parameters
+        ----------
+        body : str
+            The body of the message.
+
+        Returns
+        -------
+        tuple[str, dict]
+            The tracking ID of the order, and the order with its payment info unsealed.
+        """
+        message = json.loads(body)
+        order = dict(message['order'], payment_info=self._unseal(message['payment_info']))
+        return message['tracking_id'], order
+
+
+    @abstractmethod
+    def _send(self, body: str) -> None:
+        """Sends a message to the queue."""
+
+
+    @abstractmethod
+    def _seal(self, payment_info: dict) -> Any:
+        """Protects payment info before it's put on the queue. Returns a JSON serializable value."""
+
+
+    @abstractmethod
+    def _unseal(self, sealed: Any) -> dict:
+        """Recovers payment info sealed by `_seal`."""
+
+
+class SqsOrderQueue(OrderQueue):
+    """An order queue backed by Amazon SQS. Payment info is encrypted with a KMS key."""
+    # boto3 clients are expensive to create, share them per container
+    _client = None
+    _kms = None
+
+    # Binds the ciphertext to its use, so it can't be decrypted for another purpose
+    _ENCRYPTION_CONTEXT = {'purpose': 'order-queue-payment-info'}
+
+    _url: str
+    _key_id: str
+
+    def __init__(self, url: str, key_id: str):
+        """
+        Parameters
+        ----------
+        url : str
+            The URL of the SQS queue.
+        key_id : str
+            The ID, ARN or alias of the KMS key to encrypt payment info with.
+        """
+        self._url = url
+        self._key_id = key_id
+
+
+    def _send(self, body: str) -> None:
+        if SqsOrderQueue._client is None:
+            SqsOrderQueue._client = boto3.client('sqs')
+        SqsOrderQueue._client.send_message(QueueUrl=self._url, MessageBody=body)
+
+
+    def _seal(self, payment_info: dict) -> str:
+        ciphertext = self.__kms__().encrypt(
+            KeyId=self._key_id,
+            Plaintext=json.dumps(payment_info).encode(),
+            EncryptionContext=self._ENCRYPTION_CONTEXT
+        )['CiphertextBlob']
+        return base64.b64encode(ciphertext).decode()
+
+
+    def _unseal(self, sealed: str) -> dict:
+        plaintext = self.__kms__().decrypt(
+            KeyId=self._key_id,
+            CiphertextBlob=base64.b64decode(sealed),
+            EncryptionContext=self._ENCRYPTION_CONTEXT
+        )['Plaintext']
+        return json.loads(plaintext)
+
+
+    @staticmethod
+    def __kms__():
+        if SqsOrderQueue._kms is None:
+            SqsOrderQueue._kms = boto3.client('kms')
+        return SqsOrderQueue._kms
+
+
+class InMemoryOrderQueue(OrderQueue):
+    """
+    A local stand-in for SQS, used in tests and local runs.
+    Payment info never leaves the process: messages only carry a reference to it.
+    """
+    _messages: deque
+    _payment_infos: dict[str, dict]
+
+    def __init__(self):
+        self._messages = deque()
+        self._payment_infos = {}
+
+
+    def _send(self, body: str) -> None:
+        self._messages.append(body)
+
+
+    def _seal(self, payment_info: dict) -> str:
+        reference = str(uuid.uuid4())
+        self._payment_infos[reference] = payment_info
+        return reference
+
+
+    def _unseal(self, sealed: str) -> dict:
+        return self._payment_infos[sealed]
+
+
+    def drain(self, batch_size: int = 10) -> dict:
+        """
+        Takes up to `batch_size` messages off the queue.
+
+        Parameters
+        ----------
+        batch_size : int = 10
+            The maximum number of messages to take.
+
+        Returns
+        -------
+        dict
+            An event in the same shape as the SQS events Lambda receives.
+        """
+        records = []
+        while self._messages and len(records) < batch_size:
+            records.append({
+                'messageId': str(uuid.uuid4()),
+                'body': self._messages.popleft()
+            })
+        return {'Records': records}
+
+
+    def __len__(self) -> int:
+        return len(self._messages)
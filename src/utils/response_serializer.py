@@ -0,0 +1,89 @@
+import datetime
+import json
+from decimal import Decimal
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the standard library encoder
+    orjson = None
+
+class ResponseSerializer:
+    """
+    Serializes response bodies to JSON with the standard library encoder.
+
+    Besides the types `json` supports, handles:
+    - ``Decimal`` (e.g. ``DECIMAL(9,2)`` prices), encoded as numbers. Values with at most 15 significant
+      digits (every ``DECIMAL`` column of the schema) are written with their exact digits, e.g. ``19.99``.
+      That's also how the floats pandas reads these columns as are written, so a price is the same
+      JSON number whether it was read with SQLAlchemy or pandas.
+    - numpy and pandas scalars, encoded as the equivalent Python value.
+    - dates and timestamps, encoded in ISO 8601.
+
+    NaN and infinity are encoded as ``NaN`` and ``Infinity``, which `json` accepts but isn't valid JSON.
+    `OrjsonResponseSerializer` encodes them as ``null``, so bodies that may hold them (e.g. a float
+    column of a DataFrame with missing values) differ between the two: convert them first if it matters.
+    """
+
+    @staticmethod
+    def default() -> 'ResponseSerializer':
+        """
+        Creates the fastest serializer available.
+
+        Returns
+        -------
+        ResponseSerializer
+            An `OrjsonResponseSerializer` if orjson is installed, a `ResponseSerializer` otherwise.
+        """
+        return OrjsonResponseSerializer() if orjson is not None else ResponseSerializer()
+
+
+    def dumps(self, body: Any) -> str:
+        """
+        Serializes a response body.
+
+        Parameters
+        ----------
+        body : Any
+            The body to serialize.
+
+        Returns
+        -------
+        str
+            The JSON document.
+        """
+        return json.dumps(body, default=self._encode_default)
+
+
+    @staticmethod
+    def _encode_default(obj: Any) -> Any:
+        """Converts an object the encoder doesn't support into one it does."""
+        if isinstance(obj, Decimal):
+            # The shortest repr of the float has the same digits as the decimal, up to 15 significant digits
+            return float(obj)
+        if isinstance(obj, np.generic):
+            return obj.item()
+        if obj is pd.NA or obj is pd.NaT:
+            return None
+        if isinstance(obj, (datetime.date, datetime.time)):
+            return obj.isoformat()
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+class OrjsonResponseSerializer(ResponseSerializer):
+    """
+    Serializes response bodies to JSON with orjson, which is several times faster than the standard
+    library encoder and handles numpy scalars and dates natively. Output is equivalent to
+    `ResponseSerializer`, except NaN and infinity are encoded as ``null`` (valid JSON) instead of ``NaN``.
+    """
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError('orjson is not installed.')
+
+
+    def dumps(self, body: Any) -> str:
+        return orjson.dumps(body, default=self._encode_default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
@@ -0,0 +1,118 @@
+import random
+import time
+from typing import Any, Callable
+
+from sqlalchemy.exc import DBAPIError
+
+from utils.metrics import Metrics
+
+class RetryPolicy:
+    """
+    Retries a database operation when it fails with a transient MySQL error,
+    such as a deadlock or a lock wait timeout, using jittered exponential backoff.
+    """
+    # MySQL error codes that are safe to retry once the transaction was rolled back
+    RETRYABLE_ERROR_CODES = {
+        1205,  # ER_LOCK_WAIT_TIMEOUT
+        1213,  # ER_LOCK_DEADLOCK
+    }
+
+    _name: str
+    _max_attempts: int
+    _base_delay: float
+    _max_delay: float
+    _time_budget: float
+
+    def __init__(
+            self,
+            name: str,
+            max_attempts: int = 5,
+            base_delay: float = 0.05,
+            max_delay: float = 1.0,
+            time_budget: float = 5.0):
+        """
+        Parameters
+        ----------
+        name : str
+            The name of the operation, used as the dimension of the emitted metrics.
+        max_attempts : int = 5
+            The maximum number of times the operation is attempted.
+        base_delay : float = 0.05
+            The base backoff delay in seconds, doubled after every failed attempt.
+        max_delay : float = 1.0
+            The upper bound of a single backoff delay in seconds.
+        time_budget : float = 5.0
+            The total time in seconds that may be spent on the operation, retries included.
+            No retry is attempted if its backoff would exceed the budget.
+        """
+        self._name = name
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._time_budget = time_budget
+
+
+    @staticmethod
+    def is_retryable(err: Exception) -> bool:
+        """
+        Determines if an error raised by the database is transient.
+
+        Parameters
+        ----------
+        err : Exception
+            The error raised by the operation.
+
+        Returns
+        -------
+        bool
+            True if the error is a deadlock or lock wait timeout, False otherwise.
+        """
+        if not isinstance(err, DBAPIError) or err.orig is None:
+            return False
+        args = getattr(err.orig, 'args', ())
+        return bool(args) and args[0] in RetryPolicy.RETRYABLE_ERROR_CODES
+
+
+    def run(self, operation: Callable[[], Any]) -> Any:
+        """
+        Runs the operation, retrying it while it fails with a retryable error.
+        The operation is responsible for rolling back its own transaction before raising.
+
+        Parameters
+        ----------
+        operation : Callable[[], Any]
+            The operation to run.
+
+        Returns
+        -------
+        Any
+            The result of the operation.
+
+        Raises
+        ------
+        Exception
+            The last error raised by the operation if it is not retryable,
+            or if the attempts or the time budget are exhausted.
+        """
+        deadline = time.monotonic() + self._time_budget
+        attempt = 1
+        while True:
+            try:
+                result = operation()
+            except Exception as err:
+                if not self.is_retryable(err) or attempt >= self._max_attempts:
+                    Metrics.put_metric('DbRetries', attempt - 1, operation=self._name)
+                    raise
+
+                # Full jitter: spread out competing transactions so they don't collide again
+                delay = random.uniform(0, min(self._max_delay, self._base_delay * 2 ** (attempt - 1)))
+                if time.monotonic() + delay >= deadline:
+                    Metrics.put_metric('DbRetries', attempt - 1, operation=self._name)
+                    raise
+
+                print(f'{self._name}: retryable database error on attempt {attempt}, retrying in {delay:.3f}s')
+                time.sleep(delay)
+                attempt += 1
+            else:
+                Metrics.put_metric('DbRetries', attempt - 1, operation=self._name)
+                return result
@@ -0,0 +1,182 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+class StageTimeoutError(Exception):
+    """Raised when a stage runs longer than its timeout, or the pipeline runs past its deadline."""
+
+
+class StageFailedError(Exception):
+    """Raised when a stage raises an error. The original error is the ``__cause__``."""
+    stage_name: str
+
+    def __init__(self, stage_name: str):
+        super().__init__(f'Stage "{stage_name}" failed.')
+        self.stage_name = stage_name
+
+
+class Stage:
+    """A unit of work in a `StagePipeline`, run once all the stages it depends on are done."""
+    name: str
+    fn: Callable[[dict[str, Any]], Any]
+    depends_on: tuple[str, ...]
+    timeout: float
+
+    def __init__(self, name: str, fn: Callable[[dict[str, Any]], Any], depends_on: list[str] | None = None, timeout: float = 10.0):
+        """
+        Parameters
+        ----------
+        name : str
+            The name of the stage, unique within the pipeline. Its result is stored under this name.
+        fn : Callable[[dict[str, Any]], Any]
+            The work of the stage. Called with the results of the stages it depends on, keyed by stage name.
+        depends_on : list[str] | None = None
+            The names of the stages that need to be done before this one starts.
+        timeout : float = 10.0
+            How long (in seconds) the stage may run, from when a thread starts running it
+            (time spent waiting for a free thread doesn't count, the pipeline deadline does).
+        """
+        self.name = name
+        self.fn = fn
+        self.depends_on = tuple(depends_on or ())
+        self.timeout = timeout
+
+
+class StagePipeline:
+    """
+    Runs stages concurrently on a small thread pool shared by the container, starting every stage
+    as soon as its dependencies are done. Meant for I/O bound stages (database reads, HTTP calls).
+
+    A stage that times out, or is still running when another one fails, is abandoned: its thread
+    keeps running in the background. So stages must not have side effects (e.g. charging a card).
+    Threads can't be interrupted, so abandoned stages keep their threads busy across invocations.
+    Once half of the threads are taken by abandoned stages, the pool is replaced: the old threads
+    exit when their stage is done.
+    """
+    MAX_WORKERS = 8
+
+    # How often (seconds) to check whether queued stages started, to start their timers
+    _QUEUED_POLL_INTERVAL = 0.05
+
+    _executor: ThreadPoolExecutor = None
+    # Stages abandoned by previous runs that may still be running on `_executor`
+    _abandoned: set[Future] = set()
+
+    @staticmethod
+    def deadline_from_context(context, safety_margin: float = 1.0) -> float | None:
+        """
+        Computes a pipeline deadline from the remaining time of a Lambda invocation.
+
+        Parameters
+        ----------
+        context : LambdaContext | None
+            The context of the invocation.
+        safety_margin : float = 1.0
+            Seconds kept in reserve to finish the invocation (commit, build the response, etc.).
+
+        Returns
+        -------
+        float | None
+            The deadline as a ``time.monotonic()`` value, or None if there is no context.
+        """
+        if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+            return None
+        return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - safety_margin
+
+
+    @staticmethod
+    def run(stages: list[Stage], deadline: float | None = None) -> dict[str, Any]:
+        """
+        Runs the stages, honoring their dependencies.
+
+        Parameters
+        ----------
+        stages : list[Stage]
+            The stages to run.
+        deadline : float | None = None
+            The ``time.monotonic()`` value by which all stages need to be done, if any.
+
+        Returns
+        -------
+        dict[str, Any]
+            The result of every stage, keyed by stage name.
+
+        Raises
+        ------
+        StageTimeoutError
+            If a stage runs past its timeout or the pipeline runs past the deadline.
+        StageFailedError
+            If a stage raises an error.
+        ValueError
+            If several stages have the same name, or the dependencies can't be satisfied
+            (unknown or circular dependencies).
+        """
+        pending = {stage.name: stage for stage in stages}
+        if len(pending) != len(stages):
+            names = [stage.name for stage in stages]
+            raise ValueError(f'Duplicate stage names: {sorted({name for name in names if names.count(name) > 1})}.')
+
+        executor = StagePipeline.__executor__()
+        # Set by the worker thread when it starts running the stage, so queued stages don't time out
+        started_at: dict[str, float] = {}
+
+        def start(stage: Stage, dependencies: dict[str, Any]) -> Any:
+            started_at[stage.name] = time.monotonic()
+            return stage.fn(dependencies)
+
+        running: dict[Future, Stage] = {}
+        results = {}
+        try:
+            while pending or running:
+                for name, stage in list(pending.items()):
+                    if all(dependency in results for dependency in stage.depends_on):
+                        dependencies = {dependency: results[dependency] for dependency in stage.depends_on}
+                        running[executor.submit(start, stage, dependencies)] = stage
+                        del pending[name]
+
+                if not running:
+                    raise ValueError(f'Unsatisfiable stage dependencies: {sorted(pending)}.')
+
+                now = time.monotonic()
+                wake_at = min(
+                    started_at[stage.name] + stage.timeout if stage.name in started_at else now + StagePipeline._QUEUED_POLL_INTERVAL
+                    for stage in running.values()
+                )
+                if deadline is not None:
+                    wake_at = min(wake_at, deadline)
+                done, _ = wait(running, timeout=max(0.0, wake_at - now), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        results[stage.name] = future.result()
+                    except Exception as err:
+                        raise StageFailedError(stage.name) from err
+
+                now = time.monotonic()
+                for stage in running.values():
+                    if stage.name in started_at and now >= started_at[stage.name] + stage.timeout:
+                        raise StageTimeoutError(f'Stage "{stage.name}" timed out after {stage.timeout}s.')
+                if deadline is not None and now >= deadline and (pending or running):
+                    raise StageTimeoutError('Pipeline deadline exceeded.')
+        finally:
+            # Threads can't be interrupted, but stages that haven't started yet can be dropped
+            for future in running:
+                if not future.cancel():
+                    StagePipeline._abandoned.add(future)
+
+        return results
+
+
+    @staticmethod
+    def __executor__() -> ThreadPoolExecutor:
+        """Gets the shared thread pool, replacing it if abandoned stages took half of its threads."""
+        StagePipeline._abandoned = {future for future in StagePipeline._abandoned if not future.done()}
+        if StagePipeline._executor is None or len(StagePipeline._abandoned) >= StagePipeline.MAX_WORKERS // 2:
+            if StagePipeline._executor is not None:
+                print(f'{len(StagePipeline._abandoned)} abandoned stages still running, replacing the stage thread pool.')
+                # Doesn't wait: the threads of the old pool exit once their stage is done
+                StagePipeline._executor.shutdown(wait=False)
+            StagePipeline._executor = ThreadPoolExecutor(max_workers=StagePipeline.MAX_WORKERS, thread_name_prefix='stage')
+            StagePipeline._abandoned = set()
+        return StagePipeline._executor
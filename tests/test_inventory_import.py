@@ -0,0 +1,125 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+sa = pytest.importorskip('sqlalchemy')
+pytest.importorskip('pandas')
+pytest.importorskip('boto3')
+
+from handlers.inventory_management_handler import InventoryManagementHandler
+from models.toasterdb_orms import Inventory
+from services.inventory_service import InventoryManagingService as Service
+
+parse_int = Service.__parse_import_int__
+parse_decimal = Service.__parse_import_decimal__
+
+
+def parse(lines: list[str], format: str) -> list[tuple]:
+    return list(Service.__parse_import_rows__(lines, format))
+
+
+@pytest.mark.parametrize('value, expected', [('12', 12), (12, 12), (12.0, 12), (-5, -5)])
+def test_parse_int(value, expected):
+    assert parse_int({'stock_delta': value}, 'stock_delta') == expected
+
+
+@pytest.mark.parametrize('value', [True, 1.5, 'abc', 2**31, -2**31 - 1])
+def test_parse_int_rejects(value):
+    with pytest.raises(ValueError):
+        parse_int({'stock_delta': value}, 'stock_delta')
+
+
+def test_parse_int_minimum():
+    assert parse_int({'stock_quantity': 0}, 'stock_quantity', 0) == 0
+    with pytest.raises(ValueError):
+        parse_int({'stock_quantity': -1}, 'stock_quantity', 0)
+
+
+@pytest.mark.parametrize('value, expected', [('19.99', Decimal('19.99')), (5, Decimal('5.00')), (0.1, Decimal('0.10'))])
+def test_parse_decimal(value, expected):
+    assert parse_decimal({'unit_price': value}, Inventory.unit_price) == expected
+
+
+@pytest.mark.parametrize('value', ['1.999', '-1', 'NaN', 'Infinity', '10000000'])
+def test_parse_decimal_rejects(value):
+    with pytest.raises(ValueError):
+        parse_decimal({'unit_price': value}, Inventory.unit_price)
+
+
+def test_parse_csv_rows():
+    rows = parse([
+        'item_id,item_name,unit_price,stock_quantity,weight,stock_delta\n',
+        ',Toaster,19.99,10,1.5,\n',
+        '7,,,,,-3\n',
+        ',Toaster,abc,10,1.5,\n',
+        ',,19.99,10,1.5,\n',
+    ], 'csv')
+
+    assert rows == [
+        (1, {'item_id': None, 'item_name': 'Toaster', 'unit_price': Decimal('19.99'), 'stock_quantity': 10, 'weight': Decimal('1.50')}, None),
+        (2, {'item_id': 7, 'stock_delta': -3}, None),
+        (3, None, 'invalid value: not a decimal number'),
+        (4, None, "missing field 'item_name'"),
+    ]
+
+
+def test_parse_jsonl_rows():
+    rows = parse([
+        json.dumps({'item_id': 7, 'stock_delta': 2}) + '\n',
+        '\n',
+        '[1, 2]\n',
+        '{not json\n',
+        json.dumps({'item_id': 0, 'stock_delta': 2}) + '\n',
+    ], 'jsonl')
+
+    assert rows[0] == (1, {'item_id': 7, 'stock_delta': 2}, None)
+    assert [row_number for row_number, _, _ in rows] == [1, 3, 4, 5]
+    assert all(row is None and error.startswith('invalid value') for _, row, error in rows[1:])
+
+
+def upsert(item_name: str, item_id: int | None = None) -> dict:
+    return {'item_id': item_id, 'item_name': item_name, 'unit_price': Decimal('1.00'), 'stock_quantity': 1, 'weight': Decimal('1.00')}
+
+
+def test_match_upserts_by_name():
+    upserts = [
+        (1, upsert('Toaster')),
+        (2, upsert('Kettle', 9)),
+        (3, upsert('New Toaster')),
+        (4, upsert('Bagel')),
+        (5, upsert('new toaster')),
+    ]
+    ids_by_name = {'toaster': [12], 'bagel': [3, 4]}
+
+    rows, row_errors = Service.__match_import_upserts__(upserts, ids_by_name)
+
+    # Updates in item_id order, then one insert per new name (the last row wins)
+    assert [(row['item_id'], row['item_name']) for row in rows] == [(9, 'Kettle'), (12, 'Toaster'), (None, 'new toaster')]
+    assert row_errors == [(4, 'item_name matches several items [3, 4], use item_id')]
+    assert upserts[0][1]['item_id'] is None  # arguments are left untouched so the transaction can be retried
+
+
+def test_errors_are_reported_in_row_order(monkeypatch):
+    monkeypatch.delenv('inventory_snapshot_uri', raising=False)
+    service = Service(sa.create_engine('sqlite://'))
+    monkeypatch.setattr(service, '__apply_import_transaction__', lambda upserts, adjustments: ([(1, 'rejected')], 1, 0))
+    summary = {'rows_processed': 0, 'items_upserted': 0, 'stock_adjusted': 0, 'error_count': 0, 'errors': []}
+
+    service.__apply_import_batch__([
+        (1, upsert('Toaster'), None),
+        (2, None, 'invalid value'),
+        (3, upsert('Kettle'), None),
+    ], summary)
+
+    assert [error['row'] for error in summary['errors']] == [1, 2]
+    assert summary['rows_processed'] == 3 and summary['error_count'] == 2 and summary['items_upserted'] == 1
+
+
+def test_import_requires_an_authorizer(monkeypatch):
+    monkeypatch.delenv('inventory_snapshot_uri', raising=False)
+    handler = InventoryManagementHandler(sa.create_engine('sqlite://'))
+    event = {'body': 'item_id,stock_delta\n1,1\n', 'queryStringParameters': {'format': 'csv'}}
+
+    assert handler.post_inventory_import(event)[0] == 403
+    assert handler.post_inventory_import(dict(event, requestContext={'authorizer': None}))[0] == 403
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('boto3')
+
+from utils.inventory_snapshot import InventorySnapshot
+
+
+def make_catalog() -> 'pd.DataFrame':
+    return pd.DataFrame({
+        'item_id': [1, 2],
+        'item_name': ['toaster', 'bagel toaster'],
+        'unit_price': [19.99, 34.5],
+        'stock_quantity': [10, 0]
+    })
+
+
+def test_read_returns_what_was_written(tmp_path):
+    snapshot = InventorySnapshot(str(tmp_path / 'snapshot'))
+    snapshot.write(make_catalog())
+
+    pd.testing.assert_frame_equal(snapshot.read(), make_catalog())
+
+
+def test_stale_snapshot_is_not_served(tmp_path, monkeypatch):
+    snapshot = InventorySnapshot(str(tmp_path / 'snapshot'), max_age=60)
+    snapshot.write(make_catalog())
+
+    monkeypatch.setattr('utils.inventory_snapshot.time.time', lambda: json.loads(
+        (tmp_path / 'snapshot').read_bytes().splitlines()[0]
+    )['created_at'] + 61)
+
+    assert snapshot.read() is None
+
+
+def test_missing_or_corrupt_snapshot_is_not_served(tmp_path):
+    assert InventorySnapshot(str(tmp_path / 'missing')).read() is None
+
+    (tmp_path / 'corrupt').write_bytes(b'not a header\n{}')
+    assert InventorySnapshot(str(tmp_path / 'corrupt')).read() is None
+
+
+def test_same_version_is_parsed_once(tmp_path, monkeypatch):
+    snapshot = InventorySnapshot(str(tmp_path / 'snapshot'))
+    version = snapshot.write(make_catalog())
+    snapshot.read()
+
+    monkeypatch.setattr('utils.inventory_snapshot.pd.DataFrame', None)  # parsing again would fail
+    assert snapshot.read() is not None
+    assert InventorySnapshot._loaded[str(tmp_path / 'snapshot')][0] == version
+
+
+def test_new_version_is_picked_up(tmp_path):
+    snapshot = InventorySnapshot(str(tmp_path / 'snapshot'))
+    first = snapshot.write(make_catalog())
+    snapshot.read()
+
+    updated = make_catalog().assign(stock_quantity=[3, 4])
+    second = snapshot.write(updated)
+
+    assert first != second
+    pd.testing.assert_frame_equal(snapshot.read(), updated)
+
+
+def test_callers_get_their_own_copy(tmp_path):
+    snapshot = InventorySnapshot(str(tmp_path / 'snapshot'))
+    snapshot.write(make_catalog())
+
+    catalog = snapshot.read()
+    catalog.loc[0, 'stock_quantity'] = -1
+
+    assert snapshot.read().loc[0, 'stock_quantity'] == 10
+
+
+def test_from_environment(monkeypatch):
+    monkeypatch.delenv(InventorySnapshot.URI_ENV_VAR, raising=False)
+    assert InventorySnapshot.from_environment() is None
+
+    monkeypatch.setenv(InventorySnapshot.URI_ENV_VAR, '/tmp/snapshot')
+    monkeypatch.setenv(InventorySnapshot.MAX_AGE_ENV_VAR, 'five minutes')
+    assert InventorySnapshot.from_environment()._max_age == InventorySnapshot.DEFAULT_MAX_AGE
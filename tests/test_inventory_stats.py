@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+import pytest
+
+sa = pytest.importorskip('sqlalchemy')
+pytest.importorskip('pandas')
+pytest.importorskip('boto3')
+
+from models.toasterdb_orms import Base, CustomerOrder, CustomerOrderLineItem, Inventory
+from services.inventory_service import InventoryManagingService
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.delenv('inventory_snapshot_uri', raising=False)
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "toaster.db"}')
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(sa.insert(Inventory), [
+            {'item_id': 1, 'item_name': 'Toaster', 'unit_price': Decimal('19.99'), 'stock_quantity': 3, 'weight': 1},
+            {'item_id': 2, 'item_name': 'Kettle', 'unit_price': Decimal('0.10'), 'stock_quantity': 40, 'weight': 1},
+        ])
+    return InventoryManagingService(engine)
+
+
+def add_order(service, order_id: int, item_id: int, quantity: int):
+    with service._engine.begin() as conn:
+        conn.execute(sa.insert(CustomerOrder).values(id=order_id, customer_name='Jane Doe', status='Received', payment_confirmation_id='c'))
+        conn.execute(sa.insert(CustomerOrderLineItem).values(customer_order_id=order_id, item_id=item_id, quantity=quantity))
+
+
+def test_stats_without_sales(service):
+    stats = service.get_inventory_stats()
+
+    assert stats['total_stock_value'] == Decimal('63.97')
+    assert stats['items_sold_count'] == 0 and stats['items'] == []
+    assert [item['item_id'] for item in stats['low_stock_items']] == [1]
+
+
+def test_items_running_out_soonest_come_first(service):
+    add_order(service, 1, 1, 1)
+    add_order(service, 2, 2, 10)
+
+    items = service.get_inventory_stats(top=1)['items']
+
+    assert items == [{'item_id': 1, 'item_name': 'Toaster', 'stock_quantity': 3, 'units_sold': 1, 'velocity_per_order': 0.5, 'orders_of_cover': 6.0}]
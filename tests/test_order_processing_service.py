@@ -0,0 +1,179 @@
+import time
+from decimal import Decimal
+
+import pytest
+
+sa = pytest.importorskip('sqlalchemy')
+pytest.importorskip('pandas')
+pytest.importorskip('boto3')
+pytest.importorskip('requests')
+
+from models.toasterdb_orms import Base, CustomerOrder, CustomerOrderLineItem, Inventory
+from services.order_processing_service import OrderProcessingService as Service
+
+ORDER = {'items': [{'item_id': 1, 'quantity': 2}], 'payment_info': {'name': 'Jane Doe'}}
+
+
+def make_engine(path) -> 'sa.engine.Engine':
+    # A file, not :memory:, so the checkout stages running on other threads see the same database
+    engine = sa.create_engine(f'sqlite:///{path}', connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(sa.insert(Inventory).values(item_id=1, item_name='Toaster', unit_price=Decimal('19.99'), stock_quantity=10, weight=1))
+    return engine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return make_engine(tmp_path / 'toaster.db')
+
+
+class FakeCheckout:
+    """Stands in for the stock check and payment services."""
+
+    def __init__(self):
+        self.in_stock = True
+        self.confirmation = 'confirmation-1'
+        self.charges = []
+
+    def install(self, monkeypatch):
+        def process_payment(service, unit_prices, idempotency_key=None):
+            total = sum(item['quantity'] * unit_prices[item['item_id']] for item in service._raw_order['items'])
+            self.charges.append((idempotency_key, total))
+            return self.confirmation
+
+        monkeypatch.setattr(Service, '__item_in_stock__', lambda service, item: self.in_stock)
+        monkeypatch.setattr(Service, '__process_payment__', process_payment)
+
+
+@pytest.fixture
+def checkout(monkeypatch):
+    checkout = FakeCheckout()
+    checkout.install(monkeypatch)
+    return checkout
+
+
+def orders(engine) -> list[tuple]:
+    with engine.connect() as conn:
+        return conn.execute(sa.select(
+            CustomerOrder.id, CustomerOrder.status, CustomerOrder.payment_confirmation_id, CustomerOrder.tracking_id
+        ).order_by(CustomerOrder.id)).all()
+
+
+def stock(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(sa.select(Inventory.stock_quantity).where(Inventory.item_id == 1)).scalar()
+
+
+def line_items(engine) -> list[tuple]:
+    with engine.connect() as conn:
+        return conn.execute(sa.select(CustomerOrderLineItem.customer_order_id, CustomerOrderLineItem.unit_price)).all()
+
+
+def test_queued_order_is_charged_with_its_tracking_id(engine, checkout):
+    assert Service(engine).process_order(ORDER, 't1') == (200, 1)
+
+    assert checkout.charges == [('t1', Decimal('39.98'))]
+    assert orders(engine) == [(1, 'Received', 'confirmation-1', 't1')]
+    assert line_items(engine) == [(1, Decimal('19.99'))]
+    assert stock(engine) == 8
+
+
+def test_redelivered_order_is_not_charged_again(engine, checkout):
+    service = Service(engine)
+    service.process_order(ORDER, 't1')
+
+    assert service.process_order(ORDER, 't1') == (200, 1)
+    assert len(checkout.charges) == 1
+    assert stock(engine) == 8
+
+
+def test_order_failing_after_payment_is_resumed_without_charging(engine, checkout, monkeypatch):
+    service = Service(engine)
+    monkeypatch.setattr(Service, '__update_database_with_order__', lambda self: False)
+    assert service.process_order(ORDER, 't1')[0] == 500
+    assert service.payment_confirmation == 'confirmation-1'
+    assert orders(engine) == [(1, 'Pending', 'confirmation-1', 't1')]
+
+    monkeypatch.undo()
+    checkout.install(monkeypatch)
+    checkout.in_stock = False  # a paid order is fulfilled even if the stock changed since
+    assert service.process_order(ORDER, 't1') == (200, 1)
+    assert len(checkout.charges) == 1
+    assert orders(engine) == [(1, 'Received', 'confirmation-1', 't1')]
+    assert stock(engine) == 8
+
+
+def test_order_timing_out_before_payment_stays_pending(engine, checkout):
+    service = Service(engine)
+    assert service.process_order(ORDER, 't1', deadline=time.monotonic() - 1)[0] == 504
+    assert checkout.charges == []
+    assert orders(engine) == [(1, 'Pending', None, 't1')]
+
+    assert service.process_order(ORDER, 't1') == (200, 1)
+    assert len(checkout.charges) == 1
+
+
+def test_order_out_of_stock_is_cancelled(engine, checkout):
+    service = Service(engine)
+    checkout.in_stock = False
+    assert service.process_order(ORDER, 't1')[0] == 409
+
+    checkout.in_stock = True
+    assert service.process_order(ORDER, 't1') == (409, 'Order was already rejected.')
+    assert checkout.charges == []
+    assert orders(engine) == [(1, 'Cancelled', None, 't1')]
+    assert stock(engine) == 10
+
+
+def test_order_with_declined_payment_is_cancelled(engine, checkout):
+    checkout.confirmation = None
+    assert Service(engine).process_order(ORDER, 't1')[0] == 400
+    assert orders(engine) == [(1, 'Cancelled', None, 't1')]
+    assert line_items(engine) == []
+
+
+def test_order_is_fulfilled_once_when_deliveries_race(engine, checkout, monkeypatch):
+    first, second = Service(engine), Service(engine)
+    update_database = Service.__update_database_with_order__
+
+    def second_delivery_wins(self):
+        if self is first:
+            # The second delivery claims the same order and fulfils it before the first one commits
+            assert second.process_order(ORDER, 't1') == (200, 1)
+        return update_database(self)
+
+    monkeypatch.setattr(Service, '__update_database_with_order__', second_delivery_wins)
+    assert first.process_order(ORDER, 't1') == (200, 1)
+
+    assert stock(engine) == 8
+    assert len(line_items(engine)) == 1
+    # The second delivery found the confirmation of the first one on the claimed order
+    assert len(checkout.charges) == 1
+
+
+def test_synchronous_order_works_without_tracking_id_column(tmp_path, checkout):
+    engine = sa.create_engine(f'sqlite:///{tmp_path / "baseline.db"}', connect_args={'check_same_thread': False})
+    with engine.begin() as conn:
+        # CUSTOMER_ORDER before the queued orders migration
+        conn.execute(sa.text(
+            'CREATE TABLE "CUSTOMER_ORDER" (id INTEGER PRIMARY KEY AUTOINCREMENT, customer_name VARCHAR(50) NOT NULL,'
+            ' status VARCHAR(255), payment_confirmation_id VARCHAR(37) NOT NULL)'
+        ))
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(sa.insert(Inventory).values(item_id=1, item_name='Toaster', unit_price=Decimal('19.99'), stock_quantity=10, weight=1))
+
+    assert Service(engine).process_order(ORDER) == (200, 1)
+    assert checkout.charges == [(None, Decimal('39.98'))]
+    assert stock(engine) == 8
+
+
+def test_stock_checks_are_spread_over_a_bounded_number_of_stages(engine, checkout):
+    service = Service(engine)
+    service._raw_order = {'items': [{'item_id': 1, 'quantity': 1}] * 10, 'payment_info': {'name': 'Jane Doe'}}
+
+    stock_stages = [stage for stage in service.__checkout_stages__() if stage.name.startswith('stock_')]
+
+    assert len(stock_stages) == Service._MAX_STOCK_CHECK_STAGES
+    assert sorted(stage.timeout for stage in stock_stages) == [2 * Service._STOCK_CHECK_TIMEOUT] * 2 + [3 * Service._STOCK_CHECK_TIMEOUT] * 2
@@ -0,0 +1,142 @@
+import json
+
+import pytest
+
+sa = pytest.importorskip('sqlalchemy')
+pytest.importorskip('pandas')
+pytest.importorskip('boto3')
+pytest.importorskip('requests')
+
+from handlers.order_queue_handler import OrderQueueHandler
+from utils.order_queue import InMemoryOrderQueue, OrderQueue, SqsOrderQueue
+
+
+def make_order(name: str) -> dict:
+    return {
+        'items': [{'item_id': 1, 'quantity': 2}],
+        'payment_info': {'name': name, 'card_number': '4111111111111111', 'cvv': 123}
+    }
+
+
+class StubProcessor:
+    """Stands in for `OrderProcessingService`, with an outcome per customer name."""
+
+    def __init__(self, outcomes: dict):
+        # {customer name: (status code, message, payment confirmation) or an exception to raise}
+        self.outcomes = outcomes
+        self.processed = []
+        self.payment_confirmation = None
+
+    def process_order(self, order, tracking_id=None, deadline=None):
+        self.payment_confirmation = None
+        name = order['payment_info']['name']
+        self.processed.append((tracking_id, order))
+        outcome = self.outcomes.get(name, (200, 1, 'confirmation'))
+        if isinstance(outcome, Exception):
+            raise outcome
+        status_code, msg, self.payment_confirmation = outcome
+        return status_code, msg
+
+
+def make_handler(queue: OrderQueue, outcomes: dict) -> tuple[OrderQueueHandler, StubProcessor]:
+    handler = OrderQueueHandler(sa.create_engine('sqlite://'), queue)
+    handler._processor = StubProcessor(outcomes)
+    return handler, handler._processor
+
+
+def message_ids(event: dict, names: list[str], queue: OrderQueue) -> list[str]:
+    by_name = {queue.read(record['body'])[1]['payment_info']['name']: record['messageId'] for record in event['Records']}
+    return [by_name[name] for name in names]
+
+
+def test_enqueued_orders_reach_the_processor():
+    queue = InMemoryOrderQueue()
+    tracking_ids = [queue.enqueue(make_order(name)) for name in ('a', 'b')]
+    handler, processor = make_handler(queue, {})
+
+    response = handler.handle_batch(queue.drain(), None)
+
+    assert response == {'batchItemFailures': []}
+    assert [tracking_id for tracking_id, _ in processor.processed] == tracking_ids
+    assert processor.processed[0][1] == make_order('a')
+    assert len(queue) == 0
+
+
+def test_only_server_errors_are_retried():
+    queue = InMemoryOrderQueue()
+    for name in ('ok', 'no_stock', 'declined', 'db_down', 'timed_out', 'crashed', 'charged_then_failed'):
+        queue.enqueue(make_order(name))
+    handler, _ = make_handler(queue, {
+        'no_stock': (409, 'Not enough items in stock.', None),
+        'declined': (400, 'Could not process payment method.', None),
+        'db_down': (500, 'An error occurred.', None),
+        'timed_out': (504, 'Timed out.', None),
+        'crashed': RuntimeError('boom'),
+        'charged_then_failed': (500, 'An error occurred.', 'confirmation'),
+    })
+    event = queue.drain()
+
+    response = handler.handle_batch(event, None)
+
+    retried = [failure['itemIdentifier'] for failure in response['batchItemFailures']]
+    assert retried == message_ids(event, ['db_down', 'timed_out', 'crashed', 'charged_then_failed'], queue)
+
+
+def test_unreadable_messages_are_retried():
+    queue = InMemoryOrderQueue()
+    queue.enqueue(make_order('ok'))
+    event = queue.drain()
+    event['Records'].append({'messageId': 'broken', 'body': 'not json'})
+    handler, processor = make_handler(queue, {})
+
+    response = handler.handle_batch(event, None)
+
+    assert response == {'batchItemFailures': [{'itemIdentifier': 'broken'}]}
+    assert len(processor.processed) == 1
+
+
+def test_messages_do_not_carry_card_data():
+    queue = InMemoryOrderQueue()
+    queue.enqueue(make_order('a'))
+
+    body = queue.drain()['Records'][0]['body']
+
+    assert '4111111111111111' not in body
+    assert 'payment_info' not in json.loads(body)['order']
+
+
+class StubKms:
+    def encrypt(self, KeyId, Plaintext, EncryptionContext):
+        return {'CiphertextBlob': bytes(reversed(Plaintext))}
+
+    def decrypt(self, KeyId, CiphertextBlob, EncryptionContext):
+        return {'Plaintext': bytes(reversed(CiphertextBlob))}
+
+
+class StubSqs:
+    def __init__(self):
+        self.bodies = []
+
+    def send_message(self, QueueUrl, MessageBody):
+        self.bodies.append(MessageBody)
+
+
+def test_sqs_queue_encrypts_payment_info(monkeypatch):
+    sqs = StubSqs()
+    monkeypatch.setattr(SqsOrderQueue, '_client', sqs)
+    monkeypatch.setattr(SqsOrderQueue, '_kms', StubKms())
+    queue = SqsOrderQueue('https://sqs.example/queue', 'alias/orders')
+
+    tracking_id = queue.enqueue(make_order('a'))
+
+    assert '4111111111111111' not in sqs.bodies[0]
+    assert queue.read(sqs.bodies[0]) == (tracking_id, make_order('a'))
+
+
+def test_queue_requires_a_kms_key(monkeypatch):
+    monkeypatch.setenv(OrderQueue.URL_ENV_VAR, 'https://sqs.example/queue')
+    monkeypatch.delenv(OrderQueue.KMS_KEY_ENV_VAR, raising=False)
+    assert OrderQueue.from_environment() is None
+
+    monkeypatch.setenv(OrderQueue.KMS_KEY_ENV_VAR, 'alias/orders')
+    assert isinstance(OrderQueue.from_environment(), SqsOrderQueue)
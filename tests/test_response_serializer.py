@@ -0,0 +1,37 @@
+import datetime
+import json
+from decimal import Decimal
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pd = pytest.importorskip('pandas')
+
+from utils.response_serializer import OrjsonResponseSerializer, ResponseSerializer, orjson
+
+SERIALIZERS = [ResponseSerializer()] + ([OrjsonResponseSerializer()] if orjson is not None else [])
+
+
+@pytest.fixture(params=SERIALIZERS, ids=lambda serializer: type(serializer).__name__)
+def serializer(request):
+    return request.param
+
+
+@pytest.mark.parametrize('price', ['19.99', '5.10', '0.01', '9999999.99'])
+def test_prices_are_the_same_number_from_sqlalchemy_and_pandas(serializer, price):
+    # SQLAlchemy reads DECIMAL columns as Decimal, pandas.read_sql as float64
+    from_sqlalchemy = serializer.dumps({'unit_price': Decimal(price)})
+    from_pandas = serializer.dumps(pd.DataFrame({'unit_price': [float(price)]}).to_dict('records')[0])
+
+    assert from_sqlalchemy == from_pandas
+    assert json.loads(from_sqlalchemy, parse_float=Decimal) == {'unit_price': Decimal(price)}
+
+
+def test_numpy_pandas_and_dates(serializer):
+    body = {
+        'count': np.int64(3),
+        'missing': pd.NA,
+        'day': datetime.date(2024, 10, 20),
+    }
+
+    assert json.loads(serializer.dumps(body)) == {'count': 3, 'missing': None, 'day': '2024-10-20'}
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from utils.stage_pipeline import Stage, StagePipeline, StageFailedError, StageTimeoutError
+
+
+def test_runs_stages_after_their_dependencies():
+    order = []
+    lock = threading.Lock()
+
+    def record(name, value):
+        def fn(results):
+            with lock:
+                order.append(name)
+            return value(results)
+        return fn
+
+    results = StagePipeline.run([
+        Stage('total', record('total', lambda r: r['a'] + r['b']), depends_on=['a', 'b']),
+        Stage('a', record('a', lambda _: 1)),
+        Stage('b', record('b', lambda _: 2)),
+    ])
+
+    assert results == {'a': 1, 'b': 2, 'total': 3}
+    assert order[-1] == 'total'
+
+
+def test_runs_independent_stages_concurrently():
+    barrier = threading.Barrier(3, timeout=2)
+    stages = [Stage(name, lambda _: barrier.wait()) for name in ('a', 'b', 'c')]
+
+    # Would raise BrokenBarrierError (StageFailedError) if the stages ran one after another
+    results = StagePipeline.run(stages)
+
+    assert set(results) == {'a', 'b', 'c'}
+
+
+def test_stage_timeout():
+    with pytest.raises(StageTimeoutError, match='slow'):
+        StagePipeline.run([
+            Stage('slow', lambda _: time.sleep(1), timeout=0.05),
+            Stage('fast', lambda _: None),
+        ])
+
+
+def test_deadline():
+    started = time.monotonic()
+
+    with pytest.raises(StageTimeoutError, match='deadline'):
+        StagePipeline.run([Stage('slow', lambda _: time.sleep(1), timeout=5)], deadline=time.monotonic() + 0.05)
+
+    assert time.monotonic() - started < 0.5
+
+
+def test_dependents_of_a_failed_stage_do_not_run():
+    ran = []
+
+    def fail(_):
+        raise RuntimeError('boom')
+
+    with pytest.raises(StageFailedError) as err:
+        StagePipeline.run([
+            Stage('failing', fail),
+            Stage('dependent', lambda _: ran.append(True), depends_on=['failing']),
+        ])
+
+    assert err.value.stage_name == 'failing'
+    assert isinstance(err.value.__cause__, RuntimeError)
+    assert not ran
+
+
+def test_rejects_duplicate_stage_names():
+    with pytest.raises(ValueError, match='Duplicate'):
+        StagePipeline.run([Stage('a', lambda _: 1), Stage('a', lambda _: 2)])
+
+
+def test_rejects_unsatisfiable_dependencies():
+    with pytest.raises(ValueError, match='Unsatisfiable'):
+        StagePipeline.run([Stage('a', lambda _: 1, depends_on=['missing'])])
+
+
+def test_deadline_from_context():
+    class Context:
+        def get_remaining_time_in_millis(self):
+            return 3000
+
+    deadline = StagePipeline.deadline_from_context(Context(), safety_margin=1.0)
+
+    assert deadline - time.monotonic() == pytest.approx(2.0, abs=0.1)
+    assert StagePipeline.deadline_from_context(None) is None
+
+
+@pytest.fixture
+def small_pool(monkeypatch):
+    monkeypatch.setattr(StagePipeline, 'MAX_WORKERS', 2)
+    monkeypatch.setattr(StagePipeline, '_executor', None)
+    monkeypatch.setattr(StagePipeline, '_abandoned', set())
+
+
+def test_stage_timeout_starts_when_the_stage_runs(small_pool):
+    # 4 stages on 2 threads: the last ones wait ~0.2s for a thread, more than their timeout
+    stages = [Stage(name, lambda _: time.sleep(0.2), timeout=0.15 + 0.1) for name in ('a', 'b', 'c', 'd')]
+
+    assert set(StagePipeline.run(stages)) == {'a', 'b', 'c', 'd'}
+
+
+def test_pool_is_replaced_when_abandoned_stages_take_its_threads(small_pool):
+    release = threading.Event()
+    with pytest.raises(StageTimeoutError):
+        StagePipeline.run([Stage('stuck', lambda _: release.wait(2), timeout=0.05)])
+    stuck_pool = StagePipeline._executor
+
+    # The stuck stage holds one of the two threads, the next run gets a fresh pool
+    assert StagePipeline.run([Stage('a', lambda _: 1), Stage('b', lambda _: 2)]) == {'a': 1, 'b': 2}
+    assert StagePipeline._executor is not stuck_pool
+    release.set()